@@ -0,0 +1,184 @@
+from prettytable import PrettyTable
+from ngram_score import ngram_score, ngram_files
+from metrics import Metrics
+from enigma import Enigma
+import cryptanalysis, argparse, json, os, platform, random, sys, time
+import numpy as np
+
+# Public domain text encrypted with seeded random settings to give fixed ciphertexts
+plaintext = (
+    'I propose to consider the question, Can machines think? This should begin with definitions of the meaning '
+    'of the terms machine and think. The definitions might be framed so as to reflect so far as possible the '
+    'normal use of the words, but this attitude is dangerous. If the meaning of the words machine and think are '
+    'to be found by examining how they are commonly used it is difficult to escape the conclusion that the '
+    'meaning and the answer to the question, Can machines think? is to be sought in a statistical survey such '
+    'as a Gallup poll. But this is absurd. Instead of attempting such a definition I shall replace the question '
+    'by another, which is closely related to it and is expressed in relatively unambiguous words.'
+)
+
+# Fraction by which a result may drop below the baseline before it is flagged as a regression
+default_threshold = 0.1
+
+# Function to generate a fixed ciphertext and its settings from a seed
+def seeded_ciphertext(seed, rotors=('I', 'II', 'III', 'IV', 'V'), reflector='UKW_B'):
+    rng = random.Random(seed)
+    letters = rng.sample('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 20)
+    settings = {
+        'rotors': tuple(rng.sample(rotors, 3)),
+        'rotor_positions': [rng.randint(1, 26) for _ in range(3)],
+        'ring_settings': [1] + [rng.randint(1, 26) for _ in range(2)],
+        'plugboard': [letters[i] + letters[i + 1] for i in range(0, 20, 2)]
+    }
+    e = Enigma(settings['rotors'], reflector, settings['rotor_positions'], settings['ring_settings'], settings['plugboard'])
+    return e.transform_string(plaintext), settings
+
+# Function to time a callable, returning the fastest of several repeats in seconds
+def best_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def bench_transform_string(repeat):
+    e = Enigma(['VI', 'I', 'III'], 'UKW_B', [1, 17, 12], [5, 13, 24], ['BQ', 'CR', 'DI', 'EJ', 'KW'])
+    text = plaintext * 20
+    characters = sum(char.isalpha() for char in text)
+    return characters / best_time(lambda: e.transform_string(text), repeat), 'characters/s'
+
+def bench_enigma_init(repeat):
+    machines = 2000
+    def build():
+        for _ in range(machines):
+            Enigma(['VI', 'I', 'III'], 'UKW_B', [1, 17, 12], [5, 13, 24], ['BQ', 'CR', 'DI', 'EJ', 'KW'])
+    return machines / best_time(build, repeat), 'machines/s'
+
+def bench_enigma_reconfigure(repeat):
+    machines = 2000
+    e = Enigma(['VI', 'I', 'III'], 'UKW_B', [1, 17, 12], [5, 13, 24], ['BQ', 'CR', 'DI', 'EJ', 'KW'])
+    def reconfigure():
+        for _ in range(machines):
+            e.reconfigure([1, 17, 12], [5, 13, 24], ['BQ', 'CR', 'DI', 'EJ', 'KW'])
+    return machines / best_time(reconfigure, repeat), 'machines/s'
+
+def bench_ngram_score(file_name, repeat):
+    scorer = ngram_score(f'frequencies/{file_name}')
+    text = Enigma(['I', 'II', 'III'], 'UKW_B', [1, 1, 1], [1, 1, 1], []).transform_string(plaintext * 20)
+    windows = len(text) - scorer.L + 1
+    return windows / best_time(lambda: scorer.score(text), repeat), 'windows/s'
+
+def bench_ngram_load(repeat):
+    # Compile the file first so only loading the compiled table is timed
+    ngram_score('frequencies/english_quadgrams.txt')
+    loads = 20
+    def load():
+        for _ in range(loads):
+            ngram_score('frequencies/english_quadgrams.txt')
+    return loads / best_time(load, repeat), 'loads/s'
+
+def bench_find_rotors_and_positions(scorer, repeat):
+    ciphertext, settings = seeded_ciphertext(1)
+    rotors = settings['rotors']
+    keys = 6 * 26 ** 3
+    return keys / best_time(lambda: cryptanalysis.find_rotors_and_positions(ciphertext, scorer, 100, rotors, 'UKW_B', metrics=Metrics(quiet=True)), repeat), 'keys/s'
+
+def bench_find_ring_settings(scorer, repeat):
+    ciphertext, settings = seeded_ciphertext(2)
+    # Use the correct rotor order with a spread of start positions as the base configurations
+    rng = random.Random(2)
+    top_rotor_configs = [(0, (settings['rotors'], tuple(rng.randint(1, 26) for _ in range(3)))) for _ in range(20)]
+    keys = len(top_rotor_configs) * 26 ** 2
+    return keys / best_time(lambda: cryptanalysis.find_ring_settings(ciphertext, scorer, top_rotor_configs, 'UKW_B', Metrics(quiet=True)), repeat), 'keys/s'
+
+def bench_find_plugboard(scorer, repeat):
+    ciphertext, settings = seeded_ciphertext(3)
+    best_settings = {
+        'rotors': settings['rotors'],
+        'rotor_positions': settings['rotor_positions'],
+        'ring_settings': settings['ring_settings'],
+        'score': float('-inf')
+    }
+
+    # Count the plugboards tried by the search
+    metrics = Metrics(quiet=True)
+    seconds = best_time(lambda: cryptanalysis.find_plugboard(ciphertext, scorer, dict(best_settings), 10, 'UKW_B', metrics), repeat)
+    keys = metrics.stages['plugboard']['counters']['scored'] / repeat
+    return keys / seconds, 'keys/s'
+
+# Function to run every benchmark, returning results in a JSON-serialisable dictionary
+def run_benchmarks(repeat):
+    benchmarks = {
+        'enigma.transform_string': lambda: bench_transform_string(repeat),
+        'enigma.__init__': lambda: bench_enigma_init(repeat),
+        'enigma.reconfigure': lambda: bench_enigma_reconfigure(repeat),
+    }
+    for file_name in ngram_files():
+        benchmarks[f'ngram_score.score[{file_name}]'] = lambda file_name=file_name: bench_ngram_score(file_name, repeat)
+    benchmarks['ngram_score.__init__'] = lambda: bench_ngram_load(repeat)
+
+    scorer = ngram_score('frequencies/english_quadgrams.txt')
+    benchmarks['cryptanalysis.find_rotors_and_positions'] = lambda: bench_find_rotors_and_positions(scorer, repeat)
+    benchmarks['cryptanalysis.find_ring_settings'] = lambda: bench_find_ring_settings(scorer, repeat)
+    benchmarks['cryptanalysis.find_plugboard'] = lambda: bench_find_plugboard(scorer, repeat)
+
+    results = {}
+    for name, benchmark in benchmarks.items():
+        print(f'Running {name}...', file=sys.stderr)
+        value, unit = benchmark()
+        results[name] = {'value': value, 'unit': unit}
+
+    return {
+        'metadata': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': repeat
+        },
+        'results': results
+    }
+
+# Function to compare results against a baseline, returning the names of any regressions
+def compare(results, baseline, threshold):
+    table = PrettyTable(['Benchmark', 'Baseline', 'Current', 'Change', 'Status'])
+    regressions = []
+    for name, result in results['results'].items():
+        if name not in baseline['results']:
+            table.add_row([name, '-', f'{result["value"]:.0f} {result["unit"]}', '-', 'new'])
+            continue
+
+        baseline_value = baseline['results'][name]['value']
+        change = result['value'] / baseline_value - 1
+        status = 'ok'
+        if change < -threshold:
+            status = 'REGRESSION'
+            regressions.append(name)
+        table.add_row([name, f'{baseline_value:.0f}', f'{result["value"]:.0f} {result["unit"]}', f'{change:+.1%}', status])
+
+    print(table, file=sys.stderr)
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure throughput of the Enigma engine, the scorer and each crack stage')
+    parser.add_argument('--output', help='file to write JSON results to (default: stdout)')
+    parser.add_argument('--compare', metavar='BASELINE', help='JSON results to compare against, flagging regressions')
+    parser.add_argument('--threshold', type=float, default=default_threshold, help='fractional slowdown flagged as a regression (default: 0.1)')
+    parser.add_argument('--repeat', type=int, default=3, help='number of times to repeat each benchmark, keeping the fastest')
+    args = parser.parse_args()
+
+    # Run from the repository directory so the frequencies folder can be found
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    results = run_benchmarks(args.repeat)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
@@ -0,0 +1,307 @@
+from enigma import Plugboard, state_table, to_numbers
+from metrics import Metrics
+import cryptanalysis, heapq, itertools
+import numpy as np
+
+# Function to list the places a crib can sit in the ciphertext, dropping any where a letter would encrypt to itself
+def crib_positions(numbers, crib):
+    windows = len(numbers) - len(crib) + 1
+    if windows <= 0:
+        return []
+    clash = np.zeros(windows, dtype=bool)
+    for j, letter in enumerate(crib):
+        clash |= numbers[j:j + windows] == letter
+    return np.flatnonzero(~clash).tolist()
+
+# Function to find the shortest path of unused menu edges that leaves the reached letters and comes back to them,
+# as (from, to, offset) edges, or None if there isn't one. A single edge between two reached letters closes a loop
+# on its own
+def shortest_ear(reached, edges, used):
+    best = None
+    for a, b, j in edges:
+        if j in used:
+            continue
+        if a in reached and b in reached:
+            return [(a, b, j)]
+        if (a in reached) == (b in reached):
+            continue
+        if b in reached:
+            a, b = b, a
+
+        # Search out from the new letter through letters not yet reached, for the nearest way back
+        paths = {b: [(a, b, j)]}
+        frontier = [b]
+        while frontier and not best or frontier and len(paths[frontier[0]]) + 1 < len(best):
+            c = frontier.pop(0)
+            for d, e, k in edges:
+                if k in used or k == j or c not in (d, e):
+                    continue
+                d, e = (d, e) if d == c else (e, d)
+                if e in reached:
+                    path = paths[c] + [(d, e, k)]
+                    if best is None or len(path) < len(best):
+                        best = path
+                elif e not in paths:
+                    paths[e] = paths[c] + [(d, e, k)]
+                    frontier.append(e)
+    return best
+
+# Number of crib positions tested when the position isn't known, picking those whose menus have the most loops
+MAX_MENUS = 10
+
+# Every start state (times 26) paired with every partner of the test letter, the hypotheses a menu starts from
+all_states = np.repeat(np.arange(26 ** 3, dtype=np.intp) * 26, 26)
+all_partners = np.tile(np.arange(26, dtype=np.uint8), 26 ** 3)
+
+class Menu:
+    # Build the menu for a crib at one position: a graph with a letter at each node and an edge for each crib
+    # letter joining it to its ciphertext letter, labelled with the offset of the scrambler that links them
+    def __init__(self, crib, cipher):
+        self.edges = [(int(a), int(b), j) for j, (a, b) in enumerate(zip(crib, cipher))]
+        neighbours = {}
+        for a, b, j in self.edges:
+            neighbours.setdefault(a, []).append((b, j))
+            neighbours.setdefault(b, []).append((a, j))
+
+        # Split the menu into connected pieces and keep the one with the most loops, then the most letters
+        pieces = []
+        unvisited = set(neighbours)
+        while unvisited:
+            letters = {unvisited.pop()}
+            frontier = list(letters)
+            while frontier:
+                for b, _ in neighbours[frontier.pop()]:
+                    if b not in letters:
+                        letters.add(b)
+                        frontier.append(b)
+            unvisited -= letters
+            edges = [edge for edge in self.edges if edge[0] in letters]
+            pieces.append((len(edges) - len(letters) + 1, len(letters), sorted(letters), edges))
+        self.loops, _, self.letters, piece_edges = max(pieces)
+
+        # Order the menu so loops close as early as possible, since each closed loop drops all but about 1 in 26 of
+        # the hypotheses still being tested. Start the test register on the shortest loop, then keep adding the
+        # shortest path out from the letters reached and back again, leaving the letters on no loop until last
+        starts = [(shortest_ear({a}, piece_edges, set()), a) for a in self.letters]
+        starts = [(len(ear), -len(neighbours[a]), a, ear) for ear, a in starts if ear]
+        if starts:
+            _, _, self.test_letter, ear = min(starts)
+        else:
+            self.test_letter, ear = max(self.letters, key=lambda a: (len(neighbours[a]), -a)), None
+        self.steps = []
+        reached = {self.test_letter}
+        used = set()
+        while ear:
+            # Each edge of the path reaches a new letter, apart from the last which closes the loop
+            for i, (a, b, j) in enumerate(ear):
+                self.steps.append((i == len(ear) - 1, a, b, j))
+                reached.add(b)
+                used.add(j)
+            ear = shortest_ear(reached, piece_edges, used)
+
+        # Reach the letters on no loop, which only need their partners deducing
+        frontier = sorted(reached)
+        while frontier:
+            a = frontier.pop(0)
+            for b, j in neighbours[a]:
+                if b not in reached:
+                    reached.add(b)
+                    frontier.append(b)
+                    self.steps.append((False, a, b, j))
+
+    # Function to test every start state against every plugboard partner of the test letter, returning
+    # the surviving start states and the plugboard partners they imply for each menu letter
+    def test(self, scramblers):
+        # Try every partner of the test letter in every start state, deducing the partners of the other letters.
+        # States are kept multiplied by 26 so each scrambler lookup is a single index into its flattened table
+        states = all_states
+        partners = {self.test_letter: all_partners}
+        for loop, a, b, j in self.steps:
+            # Until a loop closes the test letter's partners run through every letter in order, so need no lookup
+            if a == self.test_letter and len(states) == 26 ** 4:
+                scrambled = scramblers[j].ravel()
+            else:
+                scrambled = scramblers[j].ravel()[states + partners[a]]
+            if not loop:
+                partners[b] = scrambled
+                continue
+            # A hypothesis survives only if the loop leads back to the partner already deduced
+            keep = np.flatnonzero(scrambled == partners[b])
+            states = states[keep]
+            partners = {letter: values[keep] for letter, values in partners.items()}
+        states = states // 26
+        values = np.array([partners[a] for a in self.letters], dtype=np.int32).reshape(len(self.letters), -1)
+
+        # Diagonal board: no two letters can share a partner, and plugboard pairs must agree in both directions.
+        # Partners are all different exactly when their bits never overlap, so adding them matches or-ing them.
+        # This check is cheap and drops nearly every wrong hypothesis, so it goes first
+        if len(self.letters) > 1:
+            bits = np.left_shift(1, values)
+            distinct = np.flatnonzero(np.bitwise_or.reduce(bits, axis=0) == bits.sum(axis=0))
+            states, values = states[distinct], values[:, distinct]
+        position = np.full(26, -1)
+        position[self.letters] = np.arange(len(self.letters))
+        letters = np.array(self.letters)[:, None]
+        in_menu = position[values] >= 0
+        reverse = values[np.where(in_menu, position[values], 0), np.arange(len(states))]
+        consistent = (~in_menu | (reverse == letters)).all(axis=0)
+
+        return states[consistent], values[:, consistent]
+
+# Function to list where the middle rotor could turn over within a crib, as the offset of the first crib letter after
+# the turnover (and every 26 letters after that), or None for no turnover, which is only possible up to 26 letters
+def turnover_offsets(length):
+    return list(range(1, 27)) if length > 26 else list(range(1, length)) + [None]
+
+# Function to find the scrambler of every start state at each offset into a crib: the permutation of the rotors and
+# reflector with the right rotor moved on offset + 1 steps and the middle rotor moved on advance steps, one row per state
+def scramblers(table, length, advance=0):
+    states = np.arange(26 ** 3)
+    left, middle, right = states // 676, (states // 26 + advance) % 26, states % 26
+    return [table.permutations[left * 676 + middle * 26 + (right + j + 1) % 26] for j in range(length)]
+
+# Function to run the bombe over every rotor order, yielding a list of the stops of each in turn: the rotor positions
+# at the start of the message (with ring settings of 1) and the plugboard pairs deduced for the menu letters. The ring setting of the
+# right rotor decides where the middle rotor turns over, so each menu is tested once for every place it could.
+# Menus without loops can't rule anything out and are skipped. If the crib position isn't known, menus with
+# fewer than min_loops loops are skipped too, and only the max_menus menus with the most loops are tested
+def find_stops(ciphertext, crib, available_rotors, reflector, crib_position=None, max_pairs=10, min_loops=2, max_menus=MAX_MENUS, metrics=None):
+    stage = 'bombe'
+    metrics = metrics or Metrics()
+    numbers = to_numbers(ciphertext)
+    crib = to_numbers(crib)
+    if not len(crib):
+        raise ValueError('The crib must contain at least one letter')
+
+    # Only try the crib where no letter would encrypt to itself
+    positions = crib_positions(numbers, crib)
+    if crib_position is not None:
+        positions = [position for position in positions if position == crib_position]
+    menus = [(position, Menu(crib, numbers[position:position + len(crib)])) for position in positions]
+    metrics.count(stage, 'crib_positions', len(menus))
+    menus = [(position, menu) for position, menu in menus if menu.loops >= (1 if crib_position is not None else min_loops)]
+    if crib_position is None:
+        menus = sorted(menus, key=lambda item: (-item[1].loops, -len(item[1].letters), item[0]))[:max_menus]
+    metrics.count(stage, 'menus', len(menus))
+
+    offsets = turnover_offsets(len(crib))
+    for rotors in metrics.track(stage, list(itertools.permutations(available_rotors, 3)) if menus else []):
+        stops = []
+        seen = set()
+        with metrics.timer(stage, 'decryption'):
+            table = state_table(rotors, reflector)
+            advanced = [scramblers(table, len(crib), advance) for advance in range(-(-len(crib) // 26) + 1)]
+        for turnover in offsets:
+            # Letters after each turnover see the middle rotor moved on one more step
+            variant = [advanced[0 if turnover is None or j < turnover else (j - turnover) // 26 + 1][j] for j in range(len(crib))]
+            for position, menu in menus:
+                with metrics.timer(stage, 'testing'):
+                    states, values = menu.test(variant)
+                    # Drop stops that need more plugboard pairs than allowed, counting pairs within the menu once
+                    letters = np.array(menu.letters)[:, None]
+                    steckered = values != letters
+                    in_menu = np.isin(values, menu.letters)
+                    allowed = (steckered & ~in_menu).sum(axis=0) + (steckered & in_menu).sum(axis=0) // 2 <= max_pairs
+                    states, values = states[allowed], values[:, allowed]
+                metrics.count(stage, 'machines', 26 ** 3)
+                metrics.count(stage, 'hypotheses', 26 ** 4)
+                metrics.count(stage, 'stops', len(states))
+
+                # Wind the rotors back from the start of the crib to the start of the message, taking off the turnovers of
+                # the middle rotor before the crib. These fall every 26 letters before the one in the crib, or if there
+                # isn't one in the crib, anywhere up to 26 letters after it
+                turnovers = {(position + turnover) // 26} if turnover else {(position + len(crib)) // 26, (position + 26) // 26}
+                for state, partners in zip(states.tolist(), values.T.tolist()):
+                    pairs = tuple(sorted({chr(min(a, b) + 65) + chr(max(a, b) + 65) for a, b in zip(menu.letters, partners) if a != b}))
+                    left, middle, right = state // 676, state // 26 % 26, (state - position) % 26
+                    for count in sorted(turnovers):
+                        rotor_positions = (left + 1, (middle - count) % 26 + 1, right + 1)
+                        # The same stop can be found with different turnover places
+                        if (rotors, rotor_positions, pairs) in seen:
+                            continue
+                        seen.add((rotors, rotor_positions, pairs))
+                        stops.append({
+                            'rotors': rotors,
+                            'rotor_positions': rotor_positions,
+                            'crib_position': position,
+                            'plugboard': list(pairs)
+                        })
+        yield stops
+
+# Function to rank stops by the score of the message decrypted with their rotor positions and plugboard pairs,
+# returning the top N. The stops come a rotor order at a time and only the top N are kept, so a menu with few
+# loops can give millions of stops without holding them all
+def rank_stops(ciphertext, scorer, stops, reflector, top_n, metrics=None):
+    stage = 'stops'
+    metrics = metrics or Metrics()
+    numbers = to_numbers(ciphertext)
+
+    top_stops = []
+    count = 0
+    for rotor_stops in stops:
+        if not rotor_stops:
+            continue
+        table = state_table(rotor_stops[0]['rotors'], reflector)
+        for batch in cryptanalysis.batches(rotor_stops, len(numbers)):
+            # Pass the message through each stop's plugboard pairs, the rotors and reflector, then the plugboard again
+            with metrics.timer(stage, 'decryption'):
+                plugboards = np.array([Plugboard(stop['plugboard']).wiring for stop in batch])
+                states = table.walk(table.state_index([stop['rotor_positions'] for stop in batch]), len(numbers))
+                inner = table.permutations.ravel()[states * 26 + plugboards[:, numbers].T]
+                decrypted = np.take_along_axis(plugboards, inner.T, axis=1)
+            metrics.count(stage, 'machines', len(batch))
+            metrics.count(stage, 'characters', decrypted.size)
+            with metrics.timer(stage, 'scoring'):
+                scores = scorer.score_batch(decrypted)
+            metrics.count(stage, 'scorer_calls')
+            metrics.count(stage, 'scored', len(batch))
+
+            # Keep the top N, with earlier stops winning ties
+            for score, stop in zip(scores.tolist(), batch):
+                entry = (score, -count, stop)
+                count += 1
+                if len(top_stops) < top_n:
+                    heapq.heappush(top_stops, entry)
+                elif entry > top_stops[0]:
+                    heapq.heapreplace(top_stops, entry)
+
+    return [stop for _, _, stop in sorted(top_stops, key=lambda entry: entry[:2], reverse=True)]
+
+# Function to crack a message from a crib: run the bombe, keep the top N stops, search ring settings for each
+# with its plugboard pairs, then hill climb the rest of the plugboard from the stops that score best
+def crack_with_crib(ciphertext, crib, scorer, available_rotors, reflector, max_pairs=10, crib_position=None, top_n=1000, top_stops=10, max_menus=MAX_MENUS, metrics=None):
+    metrics = metrics or Metrics()
+    stops = find_stops(ciphertext, crib, available_rotors, reflector, crib_position, max_pairs, max_menus=max_menus, metrics=metrics)
+    stops = rank_stops(ciphertext, scorer, stops, reflector, top_n, metrics)
+
+    # Search the stops quietly, showing a single progress bar over all of them
+    candidates = []
+    stop_metrics = Metrics(quiet=True)
+    for stop in metrics.track('ring_settings', stops):
+        best_settings = cryptanalysis.find_ring_settings(
+            ciphertext, scorer, [(0, (stop['rotors'], stop['rotor_positions']))], reflector, stop_metrics, stop['plugboard']
+        )
+        best_settings['crib_position'] = stop['crib_position']
+        candidates.append(best_settings)
+    metrics.merge(stop_metrics)
+    candidates.sort(key=lambda best_settings: best_settings['score'], reverse=True)
+
+    best_settings = {}
+    for candidate in candidates[:top_stops]:
+        candidate = cryptanalysis.find_plugboard(ciphertext, scorer, candidate, max_pairs, reflector, metrics)
+        if not best_settings or candidate['score'] > best_settings['score']:
+            best_settings = candidate
+
+    # Search the ring settings again now the whole plugboard is known, since a partial plugboard can
+    # leave the exact turnover point of the middle rotor unclear
+    if best_settings:
+        rotor_positions = tuple(
+            (position - ring) % 26 + 1 for position, ring in zip(best_settings['rotor_positions'], best_settings['ring_settings'])
+        )
+        refined = cryptanalysis.find_ring_settings(
+            ciphertext, scorer, [(0, (best_settings['rotors'], rotor_positions))], reflector, metrics, best_settings['plugboard']
+        )
+        if refined['score'] > best_settings['score']:
+            best_settings.update(refined)
+
+    return best_settings
@@ -0,0 +1,50 @@
+import gzip, hashlib, heapq, json, os, time
+
+class Checkpoint:
+    # Periodically save the progress of a rotor search so it can be resumed after being interrupted
+    def __init__(self, path, settings=None, interval=60.0, resume=True):
+        self.path = path
+        self.resume = resume
+        self.settings = dict(settings or {})
+        self.interval = interval
+        self.completed = set()
+        self.heap = []
+        self.last_save = time.monotonic()
+
+    # Function to make a hash of the ciphertext so checkpoints don't need to store it
+    @staticmethod
+    def fingerprint(ciphertext):
+        return hashlib.sha256(ciphertext.encode()).hexdigest()
+
+    # Function to load saved progress, returning the completed rotor orders and top N heap
+    def load(self, search_settings):
+        self.settings.update(search_settings)
+        if self.resume and os.path.exists(self.path):
+            with gzip.open(self.path, 'rt') as file:
+                state = json.load(file)
+            if state['settings'] != json.loads(json.dumps(self.settings)):
+                raise ValueError(f'Checkpoint {self.path} was made with different settings')
+            self.completed = {tuple(rotors) for rotors in state['completed']}
+            self.heap = [(score, (tuple(rotors), tuple(position))) for score, rotors, position in state['heap']]
+            heapq.heapify(self.heap)
+        return self.completed, self.heap
+
+    # Function to record rotor orders as complete along with the current top N heap, saving if the interval has passed
+    def update(self, rotor_orders, heap):
+        self.completed.update(tuple(rotors) for rotors in rotor_orders)
+        self.heap = heap
+        if time.monotonic() - self.last_save >= self.interval:
+            self.save()
+
+    # Function to write the checkpoint atomically, so an interrupted write never corrupts it
+    def save(self):
+        state = {
+            'settings': self.settings,
+            'completed': sorted(self.completed),
+            'heap': [[score, rotors, position] for score, (rotors, position) in self.heap]
+        }
+        temporary_path = self.path + '.tmp'
+        with gzip.open(temporary_path, 'wt') as file:
+            json.dump(state, file, separators=(',', ':'))
+        os.replace(temporary_path, self.path)
+        self.last_save = time.monotonic()
@@ -1,99 +1,425 @@
-from enigma import Enigma
-from progressbar import progressbar
-from string import ascii_uppercase
+from enigma import Plugboard, core_permutations, greek_reflector, state_table, to_numbers
+from plugboard_search import PlugboardSearch
+from metrics import Metrics
+from checkpoint import Checkpoint
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import itertools, heapq
+import numpy as np
 
-# Function to find the best rotors and rotor positions
-def find_rotors_and_positions(ciphertext, scorer, top_n, available_rotors, reflector):
-    top_rotor_configs = []
-    heapq.heapify(top_rotor_configs)
-    
-    # Generate all permutations of rotors and combinations of rotor positions
-    rotor_permutations = list(itertools.permutations(available_rotors, 3))
-    rotor_position_combinations = list(itertools.product(range(1, 27), repeat=3))
-    
-    # Iterate through each combination of rotors and rotor positions
-    for rotors in progressbar(rotor_permutations):
-        for position in rotor_position_combinations:
-            # Initialise the Enigma machine with the current settings and decrypt the ciphertext
-            e = Enigma(rotors, reflector, position, [1, 1, 1], [])
-            decrypted = e.transform_string(ciphertext)
-            # Score the decrypted text
-            score = scorer.score(decrypted)
-            # Maintain a heap of the top N scores and corresponding settings
-            if len(top_rotor_configs) < top_n:
-                heapq.heappush(top_rotor_configs, (score, (rotors, position)))
+# Number of characters decrypted per batch, bounding the memory used by each batch
+BATCH_CHARS = 1 << 21
+
+# Function to split a list of keys into batches that fit within BATCH_CHARS
+def batches(items, text_length):
+    size = max(1, BATCH_CHARS // max(1, text_length))
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+# Scorers shared by the worker processes of a parallel search
+worker_scorer = None
+worker_prefilter = None
+
+# Function to give each worker process the scorers once, when the process starts
+def init_worker(scorer, prefilter=None):
+    global worker_scorer, worker_prefilter
+    worker_scorer, worker_prefilter = scorer, prefilter
+
+# Function to search a shard of rotor orders in a worker process, returning its heap and metrics
+def search_shard(numbers, top_n, rotor_permutations, reflector, prefilter_keep, segment_length=0):
+    metrics = Metrics(quiet=True)
+    heap = search_rotor_orders(numbers, worker_scorer, top_n, rotor_permutations, reflector, worker_prefilter, prefilter_keep, metrics, segment_length=segment_length)
+    return heap, metrics
+
+# Function to rank a batch with a cheap scorer and keep only the top fraction for full scoring
+def prefilter_candidates(decrypted, prefilter, prefilter_keep):
+    if prefilter is None or prefilter_keep >= 1:
+        return np.arange(len(decrypted))
+    keep = max(1, int(np.ceil(prefilter_keep * len(decrypted))))
+    scores = prefilter.score_batch(decrypted)
+    return np.sort(np.argpartition(-scores, keep - 1)[:keep])
+
+# Function to decrypt and score a batch of start states a segment at a time, dropping each candidate as soon as
+# its score so far plus the best possible score of its remaining windows falls below the threshold. Returns the
+# indices of the candidates that were never dropped and their full scores
+def progressive_scores(numbers, table, start_states, scorer, segment_length, threshold, metrics, permutations=None):
+    stage = 'rotors_and_positions'
+    permutations = table.permutations if permutations is None else permutations
+    windows = len(numbers) - scorer.L + 1
+    survivors = np.arange(len(start_states))
+    states = np.asarray(start_states, dtype=np.int32)
+    decrypted = np.empty((len(survivors), len(numbers)), dtype=np.uint8)
+    partial = np.zeros(len(survivors))
+    done = scored = 0
+    while done < len(numbers):
+        end = min(len(numbers), done + segment_length)
+        # Carry on walking the state table from where each survivor stopped
+        with metrics.timer(stage, 'decryption'):
+            segment_states = table.walk(states, end - done)
+            decrypted[:, done:end] = permutations.ravel()[segment_states * 26 + numbers[done:end, None]].T
+            states = segment_states[-1]
+        metrics.count(stage, 'characters', decrypted.shape[0] * (end - done))
+        done = end
+
+        # Score the windows that are now complete, then drop candidates that can no longer reach the threshold
+        with metrics.timer(stage, 'scoring'):
+            complete = max(scored, done - scorer.L + 1)
+            if complete > scored:
+                partial += scorer.table[scorer.window_indices(decrypted[:, scored:done])].sum(axis=1)
+                scored = complete
+            # Allow a little slack for rounding, so a candidate is never dropped by the order of additions
+            keep = np.flatnonzero(partial + (windows - scored) * scorer.max >= threshold - 1e-6 * max(1, abs(threshold)))
+        metrics.count(stage, 'pruned', len(survivors) - len(keep))
+        survivors, states, decrypted, partial = survivors[keep], states[keep], decrypted[keep], partial[keep]
+
+    # Score the survivors in full, so their scores are exactly those of a full decryption
+    with metrics.timer(stage, 'scoring'):
+        scores = scorer.score_batch(decrypted)
+    return survivors, scores
+
+# Function to split rotor orders into contiguous shards for the worker processes. Orders sharing their three stepping
+# rotors stay in the same shard, so each state table is only built by one process
+def shard(items, count):
+    groups = [list(group) for _, group in itertools.groupby(items, key=lambda rotors: rotors[-3:])]
+    shards = [sum(groups[i * len(groups) // count:(i + 1) * len(groups) // count], []) for i in range(count)]
+    return [rotor_shard for rotor_shard in shards if rotor_shard]
+
+# Every combination of start positions for three rotors
+rotor_position_combinations = list(itertools.product(range(1, 27), repeat=3))
+
+# Function to list the permutations of every rotor state for a rotor order. A four rotor (M4) order has one for each
+# position of its Greek rotor, which never steps, so it is folded into the reflector and the rest is shared
+def reflector_variants(table, rotors, reflector):
+    if len(rotors) == 3:
+        return [((), table.permutations)]
+    return [((position,), table.reflect(greek_reflector(rotors[0], position, reflector))) for position in range(1, 27)]
+
+# Function to search the start positions of one rotor order (every one unless given), adding the best to a heap of the top N in place
+def search_positions(numbers, table, rotors, scorer, top_n, prefilter, prefilter_keep, metrics, top_rotor_configs, segment_length=0, variants=None, position_combinations=None):
+    stage = 'rotors_and_positions'
+    variants = variants or [((), table.permutations)]
+    position_combinations = rotor_position_combinations if position_combinations is None else position_combinations
+    for positions in batches(position_combinations, len(numbers)):
+        starts = table.state_index(positions)
+        states = None
+        for greek_positions, permutations in variants:
+            metrics.count(stage, 'machines', len(positions))
+            if segment_length and prefilter is None and len(top_rotor_configs) >= top_n and len(numbers) > segment_length:
+                # Once the heap is full, decrypt and score in segments, dropping candidates that can't reach its minimum
+                survivors, scores = progressive_scores(numbers, table, starts, scorer, segment_length, top_rotor_configs[0][0], metrics, permutations)
+                metrics.count(stage, 'scorer_calls')
+            else:
+                # Walk the state table from each start position once, reusing the walk for every Greek rotor position
+                with metrics.timer(stage, 'decryption'):
+                    if states is None:
+                        states = table.walk(starts, len(numbers))
+                    decrypted = table.decrypt_states(numbers, states, permutations=permutations)
+                metrics.count(stage, 'characters', decrypted.size)
+                # Only pass the candidates ranked highest by the prefilter on to the full scorer
+                with metrics.timer(stage, 'scoring'):
+                    survivors = prefilter_candidates(decrypted, prefilter, prefilter_keep)
+                    scores = scorer.score_batch(decrypted if len(survivors) == len(decrypted) else decrypted[survivors])
+                metrics.count(stage, 'scorer_calls', 1 if prefilter is None or prefilter_keep >= 1 else 2)
+            metrics.count(stage, 'scored', len(survivors))
+            if not len(survivors):
+                continue
+            metrics.best(stage, scores.max())
+            # Only candidates at least as good as the current minimum can enter a full heap
+            if len(top_rotor_configs) >= top_n:
+                candidates = np.flatnonzero(scores >= top_rotor_configs[0][0])
             else:
-                heapq.heappushpop(top_rotor_configs, (score, (rotors, position)))
+                candidates = range(len(survivors))
+            # Maintain a heap of the top N scores and corresponding settings
+            for i in candidates:
+                entry = (float(scores[i]), (rotors, greek_positions + positions[survivors[i]]))
+                if len(top_rotor_configs) < top_n:
+                    heapq.heappush(top_rotor_configs, entry)
+                    metrics.count(stage, 'heap_pushes')
+                else:
+                    heapq.heappushpop(top_rotor_configs, entry)
+                    metrics.count(stage, 'heap_replacements')
+
+# Function to search rotor positions for a list of rotor orders, keeping a local heap of the top N
+def search_rotor_orders(numbers, scorer, top_n, rotor_permutations, reflector, prefilter, prefilter_keep, metrics, top_rotor_configs=(), checkpoint=None, segment_length=0):
+    stage = 'rotors_and_positions'
+    top_rotor_configs = list(top_rotor_configs)
+    heapq.heapify(top_rotor_configs)
+
+    # Iterate through each combination of rotors and batches of rotor positions
+    for rotors in rotor_permutations:
+        # Build the shared table of rotor states for the three stepping rotors of this rotor order
+        with metrics.timer(stage, 'decryption'):
+            table = state_table(rotors[-3:], reflector)
+            variants = reflector_variants(table, rotors, reflector)
+        search_positions(numbers, table, rotors, scorer, top_n, prefilter, prefilter_keep, metrics, top_rotor_configs, segment_length, variants)
+
+        # Record the finished rotor order so the search can be resumed from here
+        if checkpoint:
+            checkpoint.update([rotors], top_rotor_configs)
 
     return top_rotor_configs
 
-# Function to find the best ring settings given a list of base configurations
-def find_ring_settings(ciphertext, scorer, top_rotor_configs, reflector):
+# Function to merge the local heaps of several searches into a single heap of the top N
+def merge_heaps(heaps, top_n):
+    top_rotor_configs = heapq.nlargest(top_n, itertools.chain.from_iterable(heaps))
+    heapq.heapify(top_rotor_configs)
+    return top_rotor_configs
+
+# Function to list every rotor order, with each Greek rotor in front for a four rotor (M4) machine. Orders
+# sharing their three stepping rotors are kept together so their state table is only built once
+def rotor_orders(available_rotors, greek_rotors=()):
+    rotor_permutations = list(itertools.permutations(available_rotors, 3))
+    if greek_rotors:
+        rotor_permutations = [(greek_rotor,) + rotors for rotors in rotor_permutations for greek_rotor in greek_rotors]
+    return rotor_permutations
+
+# Function to find the best rotors and rotor positions
+def find_rotors_and_positions(ciphertext, scorer, top_n, available_rotors, reflector, workers=1, prefilter=None, prefilter_keep=1, metrics=None, checkpoint=None, segment_length=0, greek_rotors=()):
+    metrics = metrics or Metrics()
+    numbers = to_numbers(ciphertext)
+
+    rotor_permutations = rotor_orders(available_rotors, greek_rotors)
+
+    # Pick up the heap and skip the rotor orders already searched if resuming from a checkpoint
+    top_rotor_configs = []
+    if checkpoint:
+        search_settings = {
+            'ciphertext': Checkpoint.fingerprint(ciphertext), 'top_n': top_n, 'rotors': list(available_rotors),
+            'reflector': reflector, 'prefilter_keep': prefilter_keep
+        }
+        if greek_rotors:
+            search_settings['greek_rotors'] = list(greek_rotors)
+        completed, top_rotor_configs = checkpoint.load(search_settings)
+        rotor_permutations = [rotors for rotors in rotor_permutations if rotors not in completed]
+
+    if workers <= 1:
+        rotor_permutations = metrics.track('rotors_and_positions', rotor_permutations)
+        top_rotor_configs = search_rotor_orders(
+            numbers, scorer, top_n, rotor_permutations, reflector, prefilter, prefilter_keep, metrics, top_rotor_configs, checkpoint, segment_length
+        )
+    else:
+        # Shard the rotor orders across worker processes, each keeping its own top N heap
+        shards = shard(rotor_permutations, workers * 4)
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(scorer, prefilter)) as executor:
+            futures = {executor.submit(search_shard, numbers, top_n, rotor_shard, reflector, prefilter_keep, segment_length): rotor_shard for rotor_shard in shards}
+            for future in metrics.track('rotors_and_positions', as_completed(futures), len(futures)):
+                heap, worker_metrics = future.result()
+                top_rotor_configs = merge_heaps([top_rotor_configs, heap], top_n)
+                metrics.merge(worker_metrics)
+                if checkpoint:
+                    checkpoint.update(futures[future], top_rotor_configs)
+
+    if checkpoint:
+        checkpoint.save()
+
+    # Merging also puts the heap in a fixed order, however the search was split up or resumed
+    return merge_heaps([top_rotor_configs], top_n)
+
+# Possible ring settings for the second and third rotors
+ring_combinations = [[1, ring2, ring3] for ring2 in range(1, 27) for ring3 in range(1, 27)]
+rings = np.array(ring_combinations)
+
+# Function to score every ring setting for a batch of start positions of one rotor order,
+# returning the scores and adjusted rotor positions with one row per start position
+def score_ring_settings(numbers, table, initial_rotor_positions, scorer, metrics, plugboard=None, permutations=None):
+    stage = 'ring_settings'
+    # Adjust the rotor positions based on the ring settings, keeping the leftmost rotor in place
+    adjusted_rotor_positions = (initial_rotor_positions[:, None, :] + rings[None, :, :] - 2) % 26 + 1
+    adjusted_rotor_positions[:, :, 0] = initial_rotor_positions[:, None, 0]
+    # Walk the state table from every adjusted position with its ring settings and decrypt the ciphertext
+    with metrics.timer(stage, 'decryption'):
+        starts = table.state_index(adjusted_rotor_positions.reshape(-1, 3))
+        if plugboard is None:
+            decrypted = table.decrypt(numbers, starts, np.tile(rings, (len(initial_rotor_positions), 1)), permutations)
+        else:
+            # Pass the text through the known plugboard pairs on the way in and out
+            decrypted = plugboard[table.decrypt(plugboard[numbers], starts, np.tile(rings, (len(initial_rotor_positions), 1)), permutations)]
+    metrics.count(stage, 'machines', len(decrypted))
+    metrics.count(stage, 'characters', decrypted.size)
+    # Score the decrypted texts
+    with metrics.timer(stage, 'scoring'):
+        scores = scorer.score_batch(decrypted).reshape(len(initial_rotor_positions), len(rings))
+    metrics.count(stage, 'scorer_calls')
+    metrics.count(stage, 'scored', scores.size)
+    metrics.best(stage, scores.max())
+    return scores, adjusted_rotor_positions
+
+# Function to find the best ring settings given a list of base configurations, optionally with known plugboard pairs
+def find_ring_settings(ciphertext, scorer, top_rotor_configs, reflector, metrics=None, plugboard=None):
+    stage = 'ring_settings'
+    metrics = metrics or Metrics()
     best_score = float('-inf')
     best_settings = {}
+    numbers = to_numbers(ciphertext)
+    plugboard_wiring = None if plugboard is None else np.array(Plugboard(plugboard).wiring, dtype=np.uint8)
 
-    # Iterate over each base configuration
-    for rotor_config in progressbar(top_rotor_configs):
-        rotors, initial_rotor_positions = rotor_config[1]
-        
-        # Iterate through possible ring settings for the second and third rotors
-        for ring2 in range(1, 27):
-            for ring3 in range(1, 27):
-                ring_settings = [1, ring2, ring3]
-                # Adjust the rotor position based on the ring settings
-                adjusted_rotor_positions = [
-                    initial_rotor_positions[0],
-                    (initial_rotor_positions[1] + ring2 - 2) % 26 + 1,
-                    (initial_rotor_positions[2] + ring3 - 2) % 26 + 1,
-                ]
-                # Initialise the Enigma machine with the current settings and decrypt the ciphertext
-                e = Enigma(rotors, reflector, adjusted_rotor_positions, ring_settings, [])
-                decrypted = e.transform_string(ciphertext)
-                # Score the decrypted text
-                score = scorer.score(decrypted)
-                # Update the best settings if the current score is higher
-                if score > best_score:
-                    best_score = score
-                    best_settings = {
-                        'rotors': rotors,
-                        'rotor_positions': adjusted_rotor_positions,
-                        'ring_settings': ring_settings,
-                        'score': score
-                    }
+    # Group the base configurations by rotor order, and the position of any Greek rotor, so each state table is only built once
+    rotor_orders = {}
+    for index, (_, (rotors, positions)) in enumerate(top_rotor_configs):
+        rotor_orders.setdefault((rotors, tuple(positions[:-3])), []).append(index)
+
+    # Find the best ring settings and score for each base configuration. Only the two rightmost rotors'
+    # ring settings matter, so the others are left at 1
+    config_results = [None] * len(top_rotor_configs)
+    for rotors, greek_positions in metrics.track(stage, rotor_orders):
+        with metrics.timer(stage, 'decryption'):
+            table = state_table(rotors[-3:], reflector)
+            permutations = table.permutations if not greek_positions else table.reflect(greek_reflector(rotors[0], greek_positions[0], reflector))
+        for indices in batches(rotor_orders[rotors, greek_positions], len(numbers) * len(rings)):
+            initial_rotor_positions = np.array([top_rotor_configs[index][1][1][-3:] for index in indices])
+            scores, adjusted_rotor_positions = score_ring_settings(numbers, table, initial_rotor_positions, scorer, metrics, plugboard_wiring, permutations)
+            # Keep the best ring settings for each configuration
+            for row, index in enumerate(indices):
+                i = int(np.argmax(scores[row]))
+                config_results[index] = (
+                    float(scores[row, i]), list(greek_positions) + adjusted_rotor_positions[row, i].tolist(), [1] * len(greek_positions) + ring_combinations[i]
+                )
+
+    # Update the best settings in the original order whenever a higher score is found
+    for rotor_config, (score, adjusted_rotor_positions, ring_settings) in zip(top_rotor_configs, config_results):
+        if score > best_score:
+            best_score = score
+            best_settings = {
+                'rotors': rotor_config[1][0],
+                'rotor_positions': adjusted_rotor_positions,
+                'ring_settings': ring_settings,
+                'score': score
+            }
+            if plugboard is not None:
+                best_settings['plugboard'] = list(plugboard)
+
+    return best_settings
+
+# Function to hill climb over plugboards for a message whose core permutations are known, updating the best settings
+def search_plugboard(numbers, permutations, scorer, best_settings, max_pairs, metrics, window_valid=None):
+    stage = 'plugboard'
+    search = PlugboardSearch(numbers, permutations, scorer, window_valid)
+
+    # Start from any plugboard pairs already known and hill climb by adding, removing and swapping pairs
+    with metrics.timer(stage, 'scoring'):
+        search.set_plugboard(Plugboard(best_settings.get('plugboard', [])).wiring)
+        search.climb(max_pairs)
+    metrics.count(stage, 'scorer_calls', search.evaluations)
+    metrics.count(stage, 'scored', search.evaluations)
+    metrics.count(stage, 'windows', search.windows)
+    metrics.best(stage, search.score)
+
+    best_settings['plugboard'] = search.connections()
+    best_settings['score'] = search.score
 
     return best_settings
 
 # Function to find the best plugboard settings
-def find_plugboard(ciphertext, scorer, best_settings, max_pairs, reflector):
-    alphabet = list(ascii_uppercase)
-    best_settings['plugboard'] = []
-
-    # Iterate to find the best plugboard pairs
-    for _ in range(max_pairs):
-        top_score = float('-inf')
-        top_pair = None
-        
-        # Test each combination of remaining letters
-        for letter_pair in itertools.combinations(alphabet, 2):
-            test_plugboard = best_settings['plugboard'] + [''.join(letter_pair)]
-            # Initialise the Enigma machine with the current settings and decrypt the ciphertext
-            e = Enigma(best_settings['rotors'], reflector, best_settings['rotor_positions'], best_settings['ring_settings'], test_plugboard)
-            decrypted = e.transform_string(ciphertext)
-            # Score the decrypted text
-            score = scorer.score(decrypted)
-            # Update the top score and pair if the current score is higher
-            if score > top_score:
-                top_score = score
-                top_pair = letter_pair
-
-        # If a top pair is found, update the best settings and remove the letters from the alphabet
-        if top_pair and top_score > best_settings['score']:
-            best_settings['score'] = top_score
-            best_settings['plugboard'].append(''.join(top_pair))
-            alphabet.remove(top_pair[0])
-            alphabet.remove(top_pair[1])
+def find_plugboard(ciphertext, scorer, best_settings, max_pairs, reflector, metrics=None):
+    stage = 'plugboard'
+    metrics = metrics or Metrics()
+    numbers = to_numbers(ciphertext)
+
+    # Find the plugboard-free permutation used for each character once, then search plugboards against it
+    with metrics.timer(stage, 'decryption'):
+        permutations = core_permutations(
+            best_settings['rotors'], reflector, best_settings['rotor_positions'], best_settings['ring_settings'], len(numbers)
+        )
+    metrics.count(stage, 'machines')
+    metrics.count(stage, 'characters', len(numbers))
+
+    return search_plugboard(numbers, permutations, scorer, best_settings, max_pairs, metrics)
+
+# Number of rotor orders kept for the ring setting search of a batch. Scores at ring settings of 1 rank the
+# right rotor order only roughly, so a good number are kept, though each adds to the ring setting search
+BATCH_ROTOR_ORDERS = 20
+
+# Function to find the best rotor orders for a batch of messages sent with the same daily key, where each
+# message has its own start positions. Each rotor order is scored by adding up the best score of every message,
+# and the top N start positions of each message are kept for the ring setting search
+def find_batch_rotors_and_positions(ciphertexts, scorer, top_n, available_rotors, reflector, top_orders=BATCH_ROTOR_ORDERS, prefilter=None, prefilter_keep=1, metrics=None):
+    stage = 'rotors_and_positions'
+    metrics = metrics or Metrics()
+    messages = [to_numbers(ciphertext) for ciphertext in ciphertexts]
+
+    top_rotor_orders = []
+    for rotors in metrics.track(stage, list(itertools.permutations(available_rotors, 3))):
+        # Build the table of rotor states once and search every message against it
+        with metrics.timer(stage, 'decryption'):
+            table = state_table(rotors, reflector)
+        message_configs = []
+        for numbers in messages:
+            top_rotor_configs = []
+            search_positions(numbers, table, rotors, scorer, top_n, prefilter, prefilter_keep, metrics, top_rotor_configs)
+            message_configs.append(sorted(top_rotor_configs, reverse=True))
+
+        # Keep the top rotor orders along with the best start positions of each message
+        score = sum(top_rotor_configs[0][0] for top_rotor_configs in message_configs)
+        message_positions = tuple(tuple(positions for _, (_, positions) in top_rotor_configs) for top_rotor_configs in message_configs)
+        entry = (score, (rotors, message_positions))
+        if len(top_rotor_orders) < top_orders:
+            heapq.heappush(top_rotor_orders, entry)
         else:
-            break
+            heapq.heappushpop(top_rotor_orders, entry)
+
+    return merge_heaps([top_rotor_orders], top_orders)
+
+# Function to find the ring settings shared by a batch of messages, scoring each ring setting by adding up
+# the best score of every message over its candidate start positions
+def find_batch_ring_settings(ciphertexts, scorer, top_rotor_orders, reflector, metrics=None):
+    stage = 'ring_settings'
+    metrics = metrics or Metrics()
+    best_score = float('-inf')
+    best_settings = {}
+    messages = [to_numbers(ciphertext) for ciphertext in ciphertexts]
+
+    for _, (rotors, message_positions) in metrics.track(stage, sorted(top_rotor_orders, reverse=True)):
+        with metrics.timer(stage, 'decryption'):
+            table = state_table(rotors, reflector)
+        totals = np.zeros(len(rings))
+        best_positions = []
+        for numbers, positions in zip(messages, message_positions):
+            # Find the best start position of this message for every ring setting
+            message_scores = np.full(len(rings), -np.inf)
+            message_positions_by_ring = np.zeros((len(rings), 3), dtype=int)
+            for batch in batches(list(positions), len(numbers) * len(rings)):
+                scores, adjusted_rotor_positions = score_ring_settings(numbers, table, np.array(batch), scorer, metrics)
+                rows = np.argmax(scores, axis=0)
+                batch_scores = scores[rows, np.arange(len(rings))]
+                better = batch_scores > message_scores
+                message_scores[better] = batch_scores[better]
+                message_positions_by_ring[better] = adjusted_rotor_positions[rows, np.arange(len(rings))][better]
+            totals += message_scores
+            best_positions.append(message_positions_by_ring)
+
+        # Keep the rotor order and ring settings with the highest total over the batch
+        i = int(np.argmax(totals))
+        if totals[i] > best_score:
+            best_score = float(totals[i])
+            best_settings = {
+                'rotors': rotors,
+                'rotor_positions': [message_positions_by_ring[i].tolist() for message_positions_by_ring in best_positions],
+                'ring_settings': ring_combinations[i],
+                'score': best_score
+            }
 
     return best_settings
+
+# Function to find the plugboard shared by a batch of messages by hill climbing over all of them at once
+def find_batch_plugboard(ciphertexts, scorer, best_settings, max_pairs, reflector, metrics=None):
+    stage = 'plugboard'
+    metrics = metrics or Metrics()
+    messages = [to_numbers(ciphertext) for ciphertext in ciphertexts]
+
+    # Find the plugboard-free permutations of each message from its own start positions
+    with metrics.timer(stage, 'decryption'):
+        permutations = [
+            core_permutations(best_settings['rotors'], reflector, rotor_positions, best_settings['ring_settings'], len(numbers))
+            for numbers, rotor_positions in zip(messages, best_settings['rotor_positions'])
+        ]
+    metrics.count(stage, 'machines', len(messages))
+    metrics.count(stage, 'characters', sum(len(numbers) for numbers in messages))
+
+    # Join the messages into one text, masking out the windows that would span two messages
+    numbers = np.concatenate(messages)
+    window_valid = np.ones(max(0, len(numbers) - scorer.L + 1), dtype=bool)
+    end = 0
+    for message in messages[:-1]:
+        end += len(message)
+        window_valid[max(0, end - scorer.L + 1):end] = False
+
+    return search_plugboard(numbers, np.concatenate(permutations), scorer, best_settings, max_pairs, metrics, window_valid)
@@ -0,0 +1,211 @@
+from cryptanalysis import merge_heaps, reflector_variants, rotor_orders, rotor_position_combinations, search_positions
+from enigma import state_table, to_numbers
+from ngram_score import ngram_score
+from metrics import Metrics
+from stage_cache import heap_from_json, heap_to_json
+from multiprocessing import Process
+import json, os, queue, socket, socketserver, threading, time
+
+# Number of start positions in each lease, splitting every rotor order into 8 leases
+LEASE_POSITIONS = 26 ** 3 // 8
+
+# Seconds a worker may hold a lease before it is handed to another worker
+LEASE_TIMEOUT = 600.0
+
+# Seconds a worker waits before asking again when every remaining lease is out with other workers
+WAIT_INTERVAL = 1.0
+
+# Seconds a worker keeps trying to reach the coordinator when starting
+CONNECT_TIMEOUT = 30.0
+
+# Function to send a message as a line of JSON
+def send(file, message):
+    file.write(json.dumps(message, separators=(',', ':')).encode() + b'\n')
+    file.flush()
+
+# Function to read a line of JSON, returning None if the connection has closed
+def receive(file):
+    line = file.readline()
+    return json.loads(line) if line else None
+
+# Function to split every rotor order into leases over ranges of start positions
+def make_leases(rotor_permutations, lease_positions=LEASE_POSITIONS):
+    starts = range(0, len(rotor_position_combinations), lease_positions)
+    return [(rotors, start, min(start + lease_positions, len(rotor_position_combinations))) for rotors in rotor_permutations for start in starts]
+
+class Coordinator:
+    # Hand out leases of the rotor search to workers over TCP and merge the top N heaps they send back
+    def __init__(self, ciphertext, ngram_file, top_n, available_rotors, reflector, host='0.0.0.0', port=0, segment_length=0, greek_rotors=(), lease_positions=LEASE_POSITIONS, lease_timeout=LEASE_TIMEOUT):
+        self.job = {
+            'ciphertext': ciphertext, 'ngram_file': ngram_file, 'top_n': top_n, 'reflector': reflector, 'segment_length': segment_length
+        }
+        self.top_n = top_n
+        self.lease_timeout = lease_timeout
+
+        self.leases = make_leases(rotor_orders(available_rotors, greek_rotors), lease_positions)
+
+        # Leases waiting for a worker, leases out with a worker (with its name and deadline) and leases finished
+        self.pending = list(range(len(self.leases)))
+        self.active = {}
+        self.completed = set()
+        self.heap = []
+        self.lock = threading.Lock()
+        self.results = queue.Queue()
+
+        coordinator = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                coordinator.serve(self.rfile, self.wfile, '%s:%d' % self.client_address[:2])
+
+        class Server(socketserver.ThreadingTCPServer):
+            allow_reuse_address = True
+            daemon_threads = True
+
+        self.server = Server((host, port), Handler)
+        self.address = self.server.server_address
+
+    # Function to hand a worker the next lease, taking back any lease whose worker has run out of time
+    def assign(self, worker):
+        with self.lock:
+            now = time.monotonic()
+            for lease_id, (holder, deadline) in list(self.active.items()):
+                if deadline < now:
+                    del self.active[lease_id]
+                    self.pending.append(lease_id)
+                    self.results.put(('reassigned', holder))
+            if self.pending:
+                lease_id = self.pending.pop(0)
+                self.active[lease_id] = (worker, now + self.lease_timeout)
+                rotors, start, stop = self.leases[lease_id]
+                return {'type': 'lease', 'id': lease_id, 'rotors': list(rotors), 'start': start, 'stop': stop}
+            if self.active:
+                return {'type': 'wait', 'seconds': WAIT_INTERVAL}
+            return {'type': 'done'}
+
+    # Function to merge the heap from a finished lease. A lease that timed out may be finished twice, so only the first counts
+    def complete(self, worker, lease_id, heap, stages):
+        with self.lock:
+            if lease_id in self.completed:
+                return
+            self.active.pop(lease_id, None)
+            if lease_id in self.pending:
+                self.pending.remove(lease_id)
+            self.completed.add(lease_id)
+            self.heap = merge_heaps([self.heap, heap_from_json(heap)], self.top_n)
+        worker_metrics = Metrics(quiet=True)
+        worker_metrics.stages = stages
+        self.results.put(('completed', worker_metrics))
+
+    # Function to put a worker's leases back in the queue when its connection is lost
+    def release(self, worker):
+        with self.lock:
+            for lease_id, (holder, _) in list(self.active.items()):
+                if holder == worker:
+                    del self.active[lease_id]
+                    self.pending.insert(0, lease_id)
+                    self.results.put(('reassigned', worker))
+
+    # Function to answer one worker's requests until it disconnects
+    def serve(self, rfile, wfile, worker):
+        try:
+            while True:
+                message = receive(rfile)
+                if message is None:
+                    break
+                if message['type'] == 'hello':
+                    send(wfile, {'type': 'job', **self.job})
+                    continue
+                if message['type'] == 'result':
+                    self.complete(worker, message['id'], message['heap'], message['stages'])
+                send(wfile, self.assign(worker))
+        except (OSError, ValueError, KeyError):
+            pass
+        finally:
+            self.release(worker)
+
+    # Function to serve workers until every lease is finished, returning the merged heap of the top N
+    def run(self, metrics=None):
+        stage = 'rotors_and_positions'
+        metrics = metrics or Metrics()
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+
+        # Show progress as each lease finishes, counting leases taken back from lost or slow workers
+        def completions():
+            done = 0
+            while done < len(self.leases):
+                event, value = self.results.get()
+                if event == 'reassigned':
+                    metrics.count(stage, 'leases_reassigned')
+                    continue
+                metrics.merge(value)
+                metrics.count(stage, 'leases')
+                done += 1
+                yield value
+
+        try:
+            for _ in metrics.track(stage, completions(), len(self.leases)):
+                pass
+        finally:
+            # Stop taking new workers; those still connected are told the search is done
+            self.server.shutdown()
+            self.server.server_close()
+
+        # Sort the heap the same way as a search on one machine
+        return merge_heaps([self.heap], self.top_n)
+
+# Function to search the start positions of a lease, returning its local top N heap and metrics
+def search_lease(numbers, scorer, top_n, rotors, reflector, start, stop, segment_length=0):
+    metrics = Metrics(quiet=True)
+    table = state_table(rotors[-3:], reflector)
+    variants = reflector_variants(table, rotors, reflector)
+    top_rotor_configs = []
+    search_positions(
+        numbers, table, rotors, scorer, top_n, None, 1, metrics, top_rotor_configs, segment_length, variants,
+        rotor_position_combinations[start:stop]
+    )
+    return top_rotor_configs, metrics
+
+# Function to connect to the coordinator, retrying while it starts up
+def connect(host, port, timeout=CONNECT_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return socket.create_connection((host, port))
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(WAIT_INTERVAL)
+
+# Function to take leases from the coordinator and search them until it says the search is done
+def run_worker(host, port, frequencies='frequencies'):
+    with connect(host, port) as connection, connection.makefile('rwb') as file:
+        send(file, {'type': 'hello'})
+        job = receive(file)
+        if job is None:
+            return
+        scorer = ngram_score(os.path.join(frequencies, job['ngram_file']))
+        numbers = to_numbers(job['ciphertext'])
+
+        send(file, {'type': 'lease'})
+        while True:
+            message = receive(file)
+            if message is None or message['type'] == 'done':
+                return
+            if message['type'] == 'wait':
+                time.sleep(message['seconds'])
+                send(file, {'type': 'lease'})
+                continue
+            heap, metrics = search_lease(
+                numbers, scorer, job['top_n'], tuple(message['rotors']), job['reflector'], message['start'], message['stop'], job['segment_length']
+            )
+            send(file, {'type': 'result', 'id': message['id'], 'heap': heap_to_json(heap), 'stages': metrics.stages})
+
+# Function to run several worker processes on this machine, each with its own connection to the coordinator
+def run_workers(host, port, processes=1, frequencies='frequencies'):
+    workers = [Process(target=run_worker, args=(host, port, frequencies)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
@@ -1,4 +1,30 @@
+from functools import lru_cache
+from types import MappingProxyType
+import numpy as np
+
+
+class Wiring:
+    # Compiled, read-only wiring of a rotor or reflector, shared by every component that uses it
+    __slots__ = ('forward', 'backward', 'notches')
+
+    def __init__(self, encoding, notch=None):
+        # Convert forward wiring from letters to numbers and invert it for the backward wiring
+        forward = tuple(ord(char) - 65 for char in encoding)
+        backward = [0] * 26
+        for i, c in enumerate(forward):
+            backward[c] = i
+
+        object.__setattr__(self, 'forward', forward)
+        object.__setattr__(self, 'backward', tuple(backward))
+        object.__setattr__(self, 'notches', frozenset(notch if isinstance(notch, list) else [] if notch is None else [notch]))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Wiring is read-only')
+
+
 class Plugboard:
+    __slots__ = ('wiring',)
+
     def __init__(self, plugboard_connections):
         self.wiring = list(range(26))
         
@@ -30,10 +56,11 @@ class Reflector:
             'UKW_C_THIN': 'RDOBJNTKVEHMLFCWZAXGYIPSUQ'
         }
     
+    __slots__ = ('forward_wiring',)
+
     def __init__(self, name):
-        # Retrieve reflector encoding and convert to numbers
-        encoding = self.reflector_encodings.get(name, 'ZYXWVUTSRQPONMLKJIHGFEDCBA')
-        self.forward_wiring = [ord(char) - 65 for char in encoding]
+        # Retrieve the compiled reflector wiring
+        self.forward_wiring = reflector_wiring(name).forward
     
     # Reflect letter through the reflector
     def reflect(self, c):
@@ -54,18 +81,16 @@ class Rotor:
             'GAMMA': ('FSOKANUERHMBTIYCWLQPZXVGJD', None)
         }
     
+    __slots__ = ('forward_wiring', 'backward_wiring', 'notches', 'rotor_position', 'ring_setting')
+
     def __init__(self, name, rotor_position, ring_setting):
-        # Get rotor encoding and notch position
-        encoding, notch = self.rotor_encodings.get(name, ('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 0))
-        
-        # Convert forward wiring from letters to numbers
-        self.forward_wiring = [ord(char) - 65 for char in encoding]
-        
-        # Create backward wiring by inverting forward wiring
-        self.backward_wiring = [self.forward_wiring.index(i) for i in range(26)]
+        # Retrieve the compiled rotor wiring and notch positions
+        wiring = rotor_wiring(name)
+        self.forward_wiring = wiring.forward
+        self.backward_wiring = wiring.backward
+        self.notches = wiring.notches
 
         # Set rotor position and ring setting
-        self.notch_position = notch
         self.rotor_position = rotor_position - 1
         self.ring_setting = ring_setting - 1
 
@@ -81,16 +106,32 @@ class Rotor:
         return self.encipher(c, self.rotor_position, self.ring_setting, self.backward_wiring)
 
     def is_at_notch(self):
-        if isinstance(self.notch_position, list):
-            return self.rotor_position in self.notch_position
-        else:
-            return self.rotor_position == self.notch_position
+        return self.rotor_position in self.notches
 
     def turnover(self):
         self.rotor_position = (self.rotor_position + 1) % 26
 
 
+# Wiring for every rotor and reflector, compiled once when the module is loaded
+rotor_wirings = MappingProxyType({name: Wiring(encoding, notch) for name, (encoding, notch) in Rotor.rotor_encodings.items()})
+reflector_wirings = MappingProxyType({name: Wiring(encoding) for name, encoding in Reflector.reflector_encodings.items()})
+
+# Wiring used for unknown names: a rotor that passes letters straight through, and a reflector that reverses the alphabet
+default_rotor_wiring = Wiring('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 0)
+default_reflector_wiring = Wiring('ZYXWVUTSRQPONMLKJIHGFEDCBA')
+
+
+def rotor_wiring(name):
+    return rotor_wirings.get(name, default_rotor_wiring)
+
+
+def reflector_wiring(name):
+    return reflector_wirings.get(name, default_reflector_wiring)
+
+
 class Enigma:
+    __slots__ = ('reflector', 'rotors', 'plugboard', 'rotor_positions', 'ring_settings')
+
     def __init__(self, rotors, reflector_name, rotor_positions, ring_settings, plugboard_connections):
         # Parse seyup parameters and convert to numbers if necessary
         rotors = [rotor.upper() for rotor in rotors]
@@ -102,7 +143,28 @@ class Enigma:
         self.rotors = [Rotor(rotor, position, setting) for rotor, position, setting in zip(rotors, rotor_positions, ring_settings)]
         self.plugboard = Plugboard(plugboard_connections)
 
-    def convert_to_numbers(self, input_list):
+        # Remember the starting settings so the machine can be reset
+        self.rotor_positions = rotor_positions[:len(self.rotors)]
+        self.ring_settings = ring_settings[:len(self.rotors)]
+
+    def reconfigure(self, rotor_positions=None, ring_settings=None, plugboard_connections=None):
+        # Change settings in place, keeping the rotors and reflector, then return to the starting positions
+        if rotor_positions is not None:
+            self.rotor_positions = self.convert_to_numbers(rotor_positions)
+        if ring_settings is not None:
+            self.ring_settings = self.convert_to_numbers(ring_settings)
+        if plugboard_connections is not None:
+            self.plugboard = Plugboard(plugboard_connections)
+        self.reset()
+
+    def reset(self):
+        # Return the rotors to their starting positions and ring settings
+        for rotor, position, setting in zip(self.rotors, self.rotor_positions, self.ring_settings):
+            rotor.rotor_position = position - 1
+            rotor.ring_setting = setting - 1
+
+    @staticmethod
+    def convert_to_numbers(input_list):
         # Convert letters to numbers for rotor positions and ring settings if necessary
         output_list = []
         for item in input_list:
@@ -153,11 +215,234 @@ class Enigma:
 
     # Transform a string through the enigma machine
     def transform_string(self, input_string, spaces=False):
-        # Transform the input string using the transform_char method
-        transformed_string = ''.join(self.transform_char(char) for char in input_string if char.isalpha())
+        return ''.join(self.transform_stream([input_string], spaces))
+
+    # Transform an iterable of text or bytes chunks, yielding one transformed chunk per input chunk
+    def transform_stream(self, chunks, spaces=False):
+        # Count letters across chunks so rotor state and 5-letter groups carry over chunk boundaries
+        count = 0
+        for chunk in chunks:
+            is_bytes = isinstance(chunk, (bytes, bytearray))
+            if is_bytes:
+                chunk = chunk.decode('ascii', 'ignore')
+
+            # Keep only the letters A to Z, as to_numbers does, since other letters have no place on the rotors
+            transformed = []
+            for char in chunk.upper():
+                if 'A' <= char <= 'Z':
+                    # Add a space before every group of 5 letters if required
+                    if spaces and count and count % 5 == 0:
+                        transformed.append(' ')
+                    transformed.append(self.transform_char(char))
+                    count += 1
+
+            transformed = ''.join(transformed)
+            if transformed:
+                yield transformed.encode('ascii') if is_bytes else transformed
+
+# Convert a string to an array of letter numbers (0-25), dropping non-letters
+def to_numbers(text):
+    return np.frombuffer(''.join(char for char in text.upper() if 'A' <= char <= 'Z').encode('ascii'), dtype=np.uint8) - 65
+
+
+# Convert an array of letter numbers (0-25) back to a string
+def to_letters(numbers):
+    return (np.asarray(numbers, dtype=np.uint8) + 65).tobytes().decode('ascii')
+
+
+# Build a lookup table of a rotor wiring for each shift (rotor position minus ring setting)
+def shifted_wiring(wiring, shifts=range(26)):
+    letters = np.arange(26)
+    shifts = np.asarray(shifts)[:, None]
+    return (np.asarray(wiring)[(letters + shifts) % 26] - shifts) % 26
+
+
+class BatchEnigma:
+    def __init__(self, rotors, reflector_name, rotor_positions, ring_settings, plugboard_connections=None):
+        # Rotor positions and ring settings are given per key, one row per machine in the batch
+        rotor_positions = np.atleast_2d(np.asarray([Enigma.convert_to_numbers(row) for row in rotor_positions], dtype=np.int32))
+        ring_settings = np.atleast_2d(np.asarray([Enigma.convert_to_numbers(row) for row in ring_settings], dtype=np.int32))
+        keys, rotor_count = rotor_positions.shape
+
+        # Rotors, reflector and plugboard can either be shared by the whole batch or given per key
+        if isinstance(rotors[0], str):
+            rotors = [rotors]
+        if isinstance(reflector_name, str):
+            reflector_name = [reflector_name]
+        if not plugboard_connections or isinstance(plugboard_connections[0], str):
+            plugboard_connections = [plugboard_connections]
+
+        # Give each distinct rotor and reflector an id so wiring is only built once per component
+        rotor_names = sorted({name.upper() for names in rotors for name in names})
+        reflector_names = sorted({name.upper() for name in reflector_name})
+        self.rotor_ids = np.broadcast_to(np.array([[rotor_names.index(name.upper()) for name in names] for names in rotors], dtype=np.int32), (keys, rotor_count))
+        self.reflector_ids = np.broadcast_to(np.array([reflector_names.index(name.upper()) for name in reflector_name], dtype=np.int32), (keys,))
+
+        # Build wiring tables for every shift (rotor position minus ring setting, -25 to 25) so each lookup is one index
+        shifts = np.arange(-25, 26)
+        self.forward_table = np.empty((len(rotor_names), 51, 26), dtype=np.int32)
+        self.backward_table = np.empty((len(rotor_names), 51, 26), dtype=np.int32)
+        self.notch_table = np.zeros((len(rotor_names), 26), dtype=bool)
+        for i, name in enumerate(rotor_names):
+            wiring = rotor_wiring(name)
+            self.forward_table[i] = shifted_wiring(wiring.forward, shifts)
+            self.backward_table[i] = shifted_wiring(wiring.backward, shifts)
+            self.notch_table[i, list(wiring.notches)] = True
+        self.reflector_table = np.array([reflector_wiring(name).forward for name in reflector_names], dtype=np.int32)
+        self.plugboard_table = np.array([Plugboard(connections).wiring for connections in plugboard_connections], dtype=np.int32)
+
+        self.rotor_positions = rotor_positions - 1
+        self.ring_settings = np.broadcast_to(ring_settings - 1, (keys, rotor_count))
+
+    def step_positions(self, length):
+        # Record the rotor positions used for each character as (length, keys) arrays, stepping all keys at once
+        start = self.rotor_positions.T
+        positions = [np.broadcast_to(row, (length, len(row))) for row in start]
+        notches = self.notch_table.ravel()
+
+        # The rightmost rotor steps on every key press, so its positions and notch hits are known up front
+        steps = np.arange(length, dtype=np.int32)[:, None]
+        positions[-1] = (start[-1] + steps + 1) % 26
+        right_notch = notches[self.rotor_ids[:, -1] * 26 + (start[-1] + steps) % 26]
+
+        # Apply the same turnover rules as Enigma.rotate, including the double step
+        left, middle = start[-3].copy(), start[-2].copy()
+        left_positions = np.empty((length, len(left)), dtype=np.int32)
+        middle_positions = np.empty((length, len(middle)), dtype=np.int32)
+        middle_offsets = self.rotor_ids[:, -2] * 26
+        for t in range(length):
+            middle_notch = notches[middle_offsets + middle]
+            left += middle_notch
+            middle += middle_notch | right_notch[t]
+            left %= 26
+            middle %= 26
+            left_positions[t] = left
+            middle_positions[t] = middle
+        positions[-3], positions[-2] = left_positions, middle_positions
+
+        self.rotor_positions = np.array([row[-1] for row in positions], dtype=np.int32).T if length else self.rotor_positions
+        return positions
+
+    def encrypt_array(self, numbers):
+        # Accept a single text shared by every key or one text per key, working in (length, keys) layout
+        numbers = np.asarray(numbers, dtype=np.int32)
+        keys = len(self.rotor_positions)
+        positions = self.step_positions(numbers.shape[-1])
+        c = numbers.T if numbers.ndim > 1 else numbers[:, None]
+
+        # Offsets into the flattened wiring tables for every character and key, one array per rotor
+        offsets = [
+            (self.rotor_ids[:, r] * 51 + 25 - self.ring_settings[:, r] + positions[r]) * 26
+            for r in range(len(positions))
+        ]
+        plugboard_offsets = np.arange(keys, dtype=np.int32) * 26 if len(self.plugboard_table) > 1 else 0
+
+        c = self.plugboard_table.ravel()[plugboard_offsets + c]
+
+        # Transform characters through rotors right to left, reflector, then left to right
+        forward_table = self.forward_table.ravel()
+        for offset in reversed(offsets):
+            c = forward_table[offset + c]
+
+        c = self.reflector_table.ravel()[self.reflector_ids * 26 + c]
+
+        backward_table = self.backward_table.ravel()
+        for offset in offsets:
+            c = backward_table[offset + c]
+
+        c = self.plugboard_table.ravel()[plugboard_offsets + c]
+
+        return np.ascontiguousarray(c.T, dtype=np.uint8)
+
+    # Transform a string through every machine in the batch
+    def transform_string(self, input_string):
+        return [to_letters(row) for row in self.encrypt_array(to_numbers(input_string))]
+
+
+# Find the permutation of the rotors and reflector (without plugboard) used for each character of a message
+def core_permutations(rotors, reflector_name, rotor_positions, ring_settings, length):
+    letters = np.repeat(np.arange(26)[:, None], length, axis=1)
+    machines = BatchEnigma(rotors, reflector_name, [rotor_positions] * 26, [ring_settings], [])
+    return np.ascontiguousarray(machines.encrypt_array(letters).T)
+
+
+class RotorStateTable:
+    def __init__(self, rotors, reflector_name):
+        # Every stepping state of three rotors with ring settings of 1, numbered left * 676 + middle * 26 + right
+        components = [rotor_wiring(rotor.upper()) for rotor in rotors]
+        states = np.arange(26 ** 3)
+        positions = [states // 676, states // 26 % 26, states % 26]
+
+        # Find the state each state steps to, using the same turnover rules as Enigma.rotate
+        middle_notch = np.isin(positions[1], list(components[1].notches))
+        right_notch = np.isin(positions[2], list(components[2].notches))
+        self.successors = (
+            (positions[0] + middle_notch) % 26 * 676
+            + (positions[1] + (middle_notch | right_notch)) % 26 * 26
+            + (positions[2] + 1) % 26
+        ).astype(np.int32)
+
+        # Find the path through the rotors towards the reflector in every state, and its inverse for the way back
+        c = np.broadcast_to(np.arange(26), (len(states), 26))
+        for wiring, position in reversed(list(zip(components, positions))):
+            c = shifted_wiring(wiring.forward)[position[:, None], c]
+        self.forward = c.astype(np.uint8)
+        self.backward = np.empty_like(self.forward)
+        np.put_along_axis(self.backward, self.forward, np.arange(26, dtype=np.uint8)[None, :], axis=1)
+
+        # Find the permutation of the rotors and reflector (without plugboard) in every state
+        self.permutations = self.reflect(reflector_wiring(reflector_name.upper()).forward)
+
+    # Function to find the permutation of every state with another reflector, reusing the paths through the rotors
+    def reflect(self, reflector):
+        return np.take_along_axis(self.backward, np.asarray(reflector, dtype=np.uint8)[self.forward], axis=1)
+
+    # Convert rotor positions (1-26, one row per key) to state numbers
+    @staticmethod
+    def state_index(rotor_positions):
+        rotor_positions = np.asarray(rotor_positions, dtype=np.int32) - 1
+        return rotor_positions[..., 0] * 676 + rotor_positions[..., 1] * 26 + rotor_positions[..., 2]
+
+    # Walk the successor table from each start state, returning the (length, keys) states used for each character
+    def walk(self, start_states, length):
+        states = np.empty((length, len(start_states)), dtype=np.int32)
+        current = np.asarray(start_states, dtype=np.int32)
+        for t in range(length):
+            current = self.successors[current]
+            states[t] = current
+        return states
+
+    # Decrypt integer-coded text from each start state, returning one row per key
+    def decrypt(self, numbers, start_states, ring_settings=None, permutations=None):
+        return self.decrypt_states(numbers, self.walk(start_states, len(numbers)), ring_settings, permutations)
+
+    # Decrypt integer-coded text using the (length, keys) states already walked, optionally with other permutations
+    def decrypt_states(self, numbers, states, ring_settings=None, permutations=None):
+        numbers = np.asarray(numbers, dtype=np.int32)
+        permutations = self.permutations if permutations is None else permutations
+
+        # Ring settings shift each rotor's wiring relative to its stepping position
+        if ring_settings is not None:
+            rings = np.asarray(ring_settings, dtype=np.int32) - 1
+            states = (
+                (states // 676 - rings[:, 0]) % 26 * 676
+                + (states // 26 - rings[:, 1]) % 26 * 26
+                + (states - rings[:, 2]) % 26
+            )
+
+        return np.ascontiguousarray(permutations.ravel()[states * 26 + numbers[:, None]].T)
+
+
+# Build the state table for a rotor order and reflector once and reuse it
+@lru_cache(maxsize=8)
+def state_table(rotors, reflector_name):
+    return RotorStateTable(rotors, reflector_name)
 
-        # Add spaces to the transformed string if required
-        if spaces:
-            transformed_string = ' '.join(transformed_string[i:i+5] for i in range(0, len(transformed_string), 5))
 
-        return transformed_string
+# Build the reflector formed by a Greek rotor (ring setting 1) at a position in front of a thin reflector. As the
+# Greek rotor never steps, an M4 machine acts like a three rotor machine with this reflector
+def greek_reflector(greek_rotor, position, reflector_name):
+    wiring = rotor_wiring(greek_rotor.upper())
+    forward = shifted_wiring(wiring.forward, [position - 1])[0]
+    backward = shifted_wiring(wiring.backward, [position - 1])[0]
+    return backward[np.array(reflector_wiring(reflector_name.upper()).forward)[forward]]
@@ -0,0 +1,114 @@
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from functools import lru_cache
+from enigma import Enigma
+import itertools, json
+
+# Number of messages sent to a worker process at a time
+MESSAGES_PER_CHUNK = 256
+
+# Number of chunks each worker may have queued, bounding the messages held in memory at once
+CHUNKS_PER_WORKER = 4
+
+# Number of machines each worker process keeps built, one per key
+CACHED_MACHINES = 64
+
+# Function to load a key sheet: a JSON object naming each key and giving its rotors, reflector,
+# rotor positions, ring settings and plugboard pairs. Each key's machine is built once here, so a bad key
+# is reported when the sheet is loaded rather than part way through a batch
+def load_key_sheet(path):
+    with open(path) as file:
+        key_sheet = json.load(file)
+    if not isinstance(key_sheet, dict):
+        raise ValueError('Key sheet must be a JSON object mapping key names to settings')
+    for name, key in key_sheet.items():
+        if not isinstance(key, dict):
+            raise ValueError(f'Key {name} must be a JSON object')
+        missing = {'rotors', 'rotor_positions', 'ring_settings'} - set(key)
+        if missing:
+            raise ValueError(f'Key {name} is missing {", ".join(sorted(missing))}')
+        if not len(key['rotors']) == len(key['rotor_positions']) == len(key['ring_settings']):
+            raise ValueError(f'Key {name} must have the same number of rotors, rotor positions, and ring settings')
+        # Plugboard raises a plain Exception for letters plugged twice, so catch everything building the machine
+        try:
+            build_machine(key)
+        except Exception as error:
+            raise ValueError(f'Key {name} is invalid: {error}')
+    return key_sheet
+
+# Function to build the machine for a key's settings
+def build_machine(key):
+    return Enigma(key['rotors'], key.get('reflector', 'UKW_B'), key['rotor_positions'], key['ring_settings'], key.get('plugboard', []))
+
+# Key sheet shared by the worker processes
+worker_key_sheet = {}
+
+# Function to give each worker process the key sheet once, when the process starts
+def init_worker(key_sheet):
+    global worker_key_sheet
+    worker_key_sheet = key_sheet
+    machine.cache_clear()
+
+# Function to build the machine for a key, keeping it so later messages with the same key only reset it
+@lru_cache(maxsize=CACHED_MACHINES)
+def machine(name):
+    return build_machine(worker_key_sheet[name])
+
+# Function to transform one message, returning it with its output. A message may give its own start
+# positions (its message key) in place of the key sheet's, and errors are recorded rather than raised
+# so one bad message doesn't stop the batch
+def transform_message(message, spaces=False):
+    result = {'message': message}
+    try:
+        if not isinstance(message, dict):
+            raise ValueError('Message must be a JSON object')
+        result = dict(message)
+        if message.get('key') not in worker_key_sheet:
+            raise ValueError(f'Unknown key {message.get("key")}')
+        rotor_positions = message.get('rotor_positions', worker_key_sheet[message['key']]['rotor_positions'])
+        if len(rotor_positions) != len(worker_key_sheet[message['key']]['rotors']):
+            raise ValueError('Number of rotor positions must match the number of rotors')
+        if not isinstance(message.get('text'), str):
+            raise ValueError('Message must have its text as a string')
+        e = machine(message['key'])
+        e.reconfigure(rotor_positions=rotor_positions)
+        result['output'] = e.transform_string(message['text'], spaces)
+    # Plugboard raises a plain Exception, so catch everything to keep one bad message from stopping the batch
+    except Exception as error:
+        result['error'] = str(error)
+    return result
+
+# Function to transform a chunk of JSONL lines in a worker process, returning the JSONL results
+def transform_chunk(lines, spaces=False):
+    results = []
+    for line in lines:
+        try:
+            message = json.loads(line)
+        except ValueError as error:
+            message = {'line': line.rstrip('\n'), 'error': f'Invalid JSON: {error}'}
+        else:
+            message = transform_message(message, spaces)
+        results.append(json.dumps(message))
+    return results
+
+# Function to transform a stream of JSONL messages, yielding JSONL results in the order the messages were read.
+# Only a few chunks per worker are in flight at once, so memory stays bounded however long the stream is
+def transform_messages(key_sheet, lines, workers=1, spaces=False, chunk_size=MESSAGES_PER_CHUNK):
+    lines = (line for line in lines if line.strip())
+    chunks = iter(lambda: list(itertools.islice(lines, chunk_size)), [])
+
+    if workers <= 1:
+        init_worker(key_sheet)
+        for chunk in chunks:
+            yield from transform_chunk(chunk, spaces)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(key_sheet,)) as executor:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(transform_chunk, chunk, spaces))
+            # Wait for the oldest chunk once enough are queued, keeping the output in order
+            if len(pending) >= workers * CHUNKS_PER_WORKER:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
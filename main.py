@@ -1,12 +1,51 @@
 from pyfiglet import Figlet
 from prettytable import PrettyTable
-from ngram_score import ngram_score
-import enigma, cryptanalysis, os, re
+from ngram_score import ngram_score, ioc_score, ngram_files
+from metrics import Metrics, exporter
+from checkpoint import Checkpoint
+from stage_cache import StageCache, heap_from_json, heap_to_json, settings_from_json
+import enigma, cryptanalysis, bombe, keysheet, distributed, argparse, copy, os, re, sys
 
 # Available rotors and reflectors for the Enigma machine
 available_rotors = list(enigma.Rotor.rotor_encodings.keys())
 available_reflectors = list(enigma.Reflector.reflector_encodings.keys())
 
+# Greek rotors that sit in front of a thin reflector in a four rotor (M4) machine
+greek_rotors = available_rotors[8:]
+
+# Default settings for the Enigma machine
+default_enigma_config = {
+    'Rotors': ['VI', 'I', 'III'],
+    'Rotor Positions': [1, 17, 12],
+    'Ring Settings': [5, 13, 24],
+    'Reflector': 'UKW_B',
+    'Plugboard Connections': ['BQ', 'CR', 'DI', 'EJ', 'KW', 'MT', 'OS', 'PX', 'UZ', 'GH']
+}
+
+# Default settings for the cryptanalysis tool
+default_crack_config = {
+    'N-Gram File': 'english_quadgrams.txt',
+    'Rotors': available_rotors[:5],
+    'Reflector': 'UKW_B',
+    'Top N': 1000,
+    'Max Pairs': 10,
+    'Workers': os.cpu_count() or 1,
+    'Prefilter': 'None',
+    'Prefilter Keep': 0.1,
+    'Quiet': False,
+    'Metrics File': '',
+    'Checkpoint File': '',
+    'Segment Length': 0,
+    'Stage Cache (MB)': 256,
+    'Batch Rotor Orders': cryptanalysis.BATCH_ROTOR_ORDERS
+}
+
+# Size of the chunks read when piping input through the Enigma machine
+chunk_size = 1 << 16
+
+# Port the coordinator of a distributed search listens on
+distributed_port = 7426
+
 def modify_array(user_config, option):
     option = list(user_config.keys())[int(option) - 1]
     input_str = input(f'\nEnter {option.lower()}: ').replace("'", '')
@@ -62,14 +101,8 @@ def clear_display():
     os.system('clear' if os.name != 'nt' else 'cls')
 
 def get_enigma_settings():
-    # Default settings for the Enigma machine
-    user_config = {
-        'Rotors': ['VI', 'I', 'III'],
-        'Rotor Positions': [1, 17, 12],
-        'Ring Settings': [5, 13, 24],
-        'Reflector': 'UKW_B',
-        'Plugboard Connections': ['BQ', 'CR', 'DI', 'EJ', 'KW', 'MT', 'OS', 'PX', 'UZ', 'GH']
-    }
+    # Start from the default settings for the Enigma machine
+    user_config = copy.deepcopy(default_enigma_config)
 
     while True:
         # Display the settings table and prompt the user to select an option
@@ -103,15 +136,139 @@ def use_enigma(user_config, plaintext):
     encrypted = e.transform_string(plaintext)
     print('\nTransformed message:', encrypted)
 
-def get_crack_settings():
-    # Default settings for the cryptanalysis tool
+def transform_file(user_config, input_file, output_file, spaces=False):
+    # Stream the input through an Enigma machine in fixed-size chunks so memory stays constant
+    e = enigma.Enigma(
+        user_config['Rotors'], user_config['Reflector'],
+        user_config['Rotor Positions'], user_config['Ring Settings'],
+        user_config['Plugboard Connections']
+    )
+    for transformed in e.transform_stream(iter(lambda: input_file.read(chunk_size), ''), spaces):
+        output_file.write(transformed)
+    output_file.write('\n')
+
+def parse_setting(value):
+    # Accept numbers or letters for rotor positions and ring settings
+    return int(value) if value.isdigit() else value.upper()
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Enigma machine simulator and cryptanalysis tool')
+    subparsers = parser.add_subparsers(dest='command')
+
+    transform_parser = subparsers.add_parser('transform', help='pipe a file or stdin through the Enigma machine')
+    transform_parser.add_argument('--rotors', nargs='+', type=str.upper, default=default_enigma_config['Rotors'])
+    transform_parser.add_argument('--rotor-positions', nargs='+', type=parse_setting, default=default_enigma_config['Rotor Positions'])
+    transform_parser.add_argument('--ring-settings', nargs='+', type=parse_setting, default=default_enigma_config['Ring Settings'])
+    transform_parser.add_argument('--reflector', type=str.upper, default=default_enigma_config['Reflector'])
+    transform_parser.add_argument('--plugboard', nargs='*', type=str.upper, default=default_enigma_config['Plugboard Connections'])
+    transform_parser.add_argument('--input', default='-', help='file to read, or - for stdin (default)')
+    transform_parser.add_argument('--output', default='-', help='file to write, or - for stdout (default)')
+    transform_parser.add_argument('--spaces', action='store_true', help='split the output into groups of 5 letters')
+
+    batch_parser = subparsers.add_parser('batch', help='encrypt a JSONL stream of messages with keys from a key sheet')
+    batch_parser.add_argument('--key-sheet', required=True, help='JSON file mapping each key name to its settings')
+    batch_parser.add_argument('--input', default='-', help='JSONL file of messages to read, or - for stdin (default)')
+    batch_parser.add_argument('--output', default='-', help='JSONL file to write, or - for stdout (default)')
+    batch_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='number of worker processes')
+    batch_parser.add_argument('--chunk-size', type=int, default=keysheet.MESSAGES_PER_CHUNK, help='messages sent to a worker at a time')
+    batch_parser.add_argument('--spaces', action='store_true', help='split the output into groups of 5 letters')
+
+    coordinate_parser = subparsers.add_parser('coordinate', help='crack a message, sharing the rotor search out to workers over TCP')
+    coordinate_parser.add_argument('--input', default='-', help='file holding the message to decrypt, or - for stdin (default)')
+    coordinate_parser.add_argument('--ngram-file', default=default_crack_config['N-Gram File'], help='file in the frequencies folder to score with')
+    coordinate_parser.add_argument('--rotors', nargs='+', type=str.upper, default=default_crack_config['Rotors'])
+    coordinate_parser.add_argument('--reflector', type=str.upper, default=default_crack_config['Reflector'])
+    coordinate_parser.add_argument('--top-n', type=int, default=default_crack_config['Top N'])
+    coordinate_parser.add_argument('--max-pairs', type=int, default=default_crack_config['Max Pairs'])
+    coordinate_parser.add_argument('--segment-length', type=int, default=default_crack_config['Segment Length'])
+    coordinate_parser.add_argument('--host', default='0.0.0.0', help='address to listen on for workers (default: all)')
+    coordinate_parser.add_argument('--port', type=int, default=distributed_port)
+    coordinate_parser.add_argument('--lease-timeout', type=float, default=distributed.LEASE_TIMEOUT, help='seconds before a lease is handed to another worker')
+    coordinate_parser.add_argument('--stage-cache-mb', type=float, default=default_crack_config['Stage Cache (MB)'], help='size of the stage cache in MB (0 to turn off)')
+    coordinate_parser.add_argument('--metrics-file', default='', help='file to export metrics to (.json or .csv)')
+    coordinate_parser.add_argument('--quiet', action='store_true', help='hide progress bars')
+
+    work_parser = subparsers.add_parser('work', help='search leases of the rotor search for a coordinator')
+    work_parser.add_argument('--host', default='localhost', help='address of the coordinator')
+    work_parser.add_argument('--port', type=int, default=distributed_port)
+    work_parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='number of worker processes to run on this machine')
+
+    args = parser.parse_args()
+    if args.command == 'batch' and args.chunk_size < 1:
+        parser.error('--chunk-size must be at least 1')
+    return args
+
+def run_transform(args):
     user_config = {
-        'N-Gram File': 'english_quintgrams.txt',
-        'Rotors': available_rotors[:5],
-        'Reflector': 'UKW_B',
-        'Top N': 1000,
-        'Max Pairs': 10
+        'Rotors': args.rotors,
+        'Rotor Positions': args.rotor_positions,
+        'Ring Settings': args.ring_settings,
+        'Reflector': args.reflector,
+        'Plugboard Connections': args.plugboard
     }
+    if not len(user_config['Rotors']) == len(user_config['Rotor Positions']) == len(user_config['Ring Settings']):
+        sys.exit('Number of rotors, rotor positions, and ring settings must match!')
+
+    input_file = sys.stdin if args.input == '-' else open(args.input)
+    output_file = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        transform_file(user_config, input_file, output_file, args.spaces)
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+def run_batch(args):
+    try:
+        key_sheet = keysheet.load_key_sheet(args.key_sheet)
+    except (OSError, ValueError) as error:
+        sys.exit(f'Could not load key sheet: {error}')
+
+    input_file = sys.stdin if args.input == '-' else open(args.input)
+    output_file = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        for result in keysheet.transform_messages(key_sheet, input_file, args.workers, args.spaces, args.chunk_size):
+            output_file.write(result + '\n')
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+
+def run_coordinate(args):
+    input_file = sys.stdin if args.input == '-' else open(args.input)
+    try:
+        ciphertext = input_file.read().strip()
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+
+    # Check the n-gram file before listening for workers, which load the same file from their own frequencies folder
+    if not os.path.isfile(f'frequencies/{args.ngram_file}'):
+        sys.exit(f'N-gram file frequencies/{args.ngram_file} not found')
+
+    user_config = copy.deepcopy(default_crack_config)
+    user_config.update({
+        'N-Gram File': args.ngram_file,
+        'Rotors': args.rotors,
+        'Reflector': args.reflector,
+        'Top N': args.top_n,
+        'Max Pairs': args.max_pairs,
+        'Segment Length': args.segment_length,
+        'Metrics File': args.metrics_file,
+        'Stage Cache (MB)': args.stage_cache_mb,
+        'Quiet': args.quiet
+    })
+    coordinator = distributed.Coordinator(
+        ciphertext, args.ngram_file, args.top_n, args.rotors, args.reflector, args.host, args.port, args.segment_length,
+        greek_rotors if args.reflector.endswith('_THIN') else (), lease_timeout=args.lease_timeout
+    )
+    crack_enigma(user_config, ciphertext, coordinator=coordinator)
+
+def get_crack_settings():
+    # Start from the default settings for the cryptanalysis tool
+    user_config = copy.deepcopy(default_crack_config)
 
     while True:
         clear_display()
@@ -123,7 +280,7 @@ def get_crack_settings():
 
         # Handle the selected option
         if chosen_setting == '1':
-            file_list = os.listdir('frequencies')
+            file_list = ngram_files()
             file_table = PrettyTable(['Option', 'File'])
             for i, file_name in enumerate(file_list):
                 file_table.add_row([i + 1, file_name])
@@ -141,28 +298,119 @@ def get_crack_settings():
             rotor_count = {'1': 5, '2': 8, '5': 5, '8': 8, '3': 3}.get(user_input)
             user_config['Rotors'] = available_rotors[:8][:rotor_count]
         elif chosen_setting == '3':
-            select_reflector(user_config, True)
+            # A thin reflector cracks a four rotor (M4) machine, trying each Greek rotor in front of it
+            select_reflector(user_config, False)
         elif chosen_setting == '4':
             user_config['Top N'] = int(input('\nEnter top N: '))
         elif chosen_setting == '5':
             user_config['Max Pairs'] = int(input('\nEnter max pairs: '))
+        elif chosen_setting == '6':
+            user_config['Workers'] = int(input('\nEnter number of worker processes: '))
+        elif chosen_setting == '7':
+            prefilter_list = ['None', 'IoC'] + ngram_files()
+            prefilter_table = PrettyTable(['Option', 'Prefilter'])
+            for i, prefilter_name in enumerate(prefilter_list):
+                prefilter_table.add_row([i + 1, prefilter_name])
+            print(prefilter_table)
+
+            user_config['Prefilter'] = prefilter_list[int(input('\nSelect prefilter: ')) - 1]
+        elif chosen_setting == '8':
+            user_config['Prefilter Keep'] = float(input('\nEnter fraction of keys kept by the prefilter: '))
+        elif chosen_setting == '9':
+            user_config['Quiet'] = not user_config['Quiet']
+        elif chosen_setting == '10':
+            user_config['Metrics File'] = input('\nEnter metrics file (.json or .csv, empty for none): ').strip()
+        elif chosen_setting == '11':
+            user_config['Checkpoint File'] = input('\nEnter checkpoint file (empty for none): ').strip()
+        elif chosen_setting == '12':
+            user_config['Segment Length'] = int(input('\nEnter segment length (0 to score whole messages): '))
+        elif chosen_setting == '13':
+            user_config['Stage Cache (MB)'] = float(input('\nEnter stage cache size in MB (0 to turn off): '))
+        elif chosen_setting == '14':
+            user_config['Batch Rotor Orders'] = int(input('\nEnter number of rotor orders kept for the batch ring setting search: '))
 
-def crack_enigma(user_config, ciphertext):
+# Load the cheap scorer used to rank keys before full N-gram scoring
+def load_prefilter(prefilter_name):
+    if prefilter_name == 'None':
+        return None
+    if prefilter_name == 'IoC':
+        return ioc_score()
+    return ngram_score(f'frequencies/{prefilter_name}')
+
+# Function to load the scorer and prefilter chosen in the crack settings, with metrics that record counts and
+# timings for each stage, periodically exporting them if a metrics file is set
+def load_crack_tools(user_config):
     scorer = ngram_score(f'frequencies/{user_config["N-Gram File"]}')
-    print('\nSearching for the best rotors and rotor positions...')
-    top_rotor_configs = cryptanalysis.find_rotors_and_positions(
-        ciphertext, scorer, user_config['Top N'], user_config['Rotors'], user_config['Reflector']
+    prefilter = load_prefilter(user_config['Prefilter'])
+    metrics_file = user_config['Metrics File']
+    metrics = Metrics(user_config['Quiet'], exporter(metrics_file) if metrics_file else None)
+    return scorer, prefilter, metrics
+
+# Function to run a crack stage, or load its result from the stage cache if it has already been run with the same settings
+def cached_stage(cache, key, metrics, stage, run, encode=lambda value: value, decode=lambda value: value):
+    value = cache.get(key) if cache else None
+    if value is not None:
+        metrics.count(stage, 'cache_hits')
+        if not metrics.quiet:
+            print('Loaded from the stage cache')
+        return decode(value)
+    value = run()
+    if cache:
+        cache.put(key, encode(value))
+    return value
+
+def crack_enigma(user_config, ciphertext, resume=False, coordinator=None):
+    scorer, prefilter, metrics = load_crack_tools(user_config)
+    metrics_file = user_config['Metrics File']
+
+    # Periodically save the rotor search so it can be resumed if interrupted
+    checkpoint = None
+    if user_config['Checkpoint File']:
+        checkpoint_settings = {'N-Gram File': user_config['N-Gram File'], 'Prefilter': user_config['Prefilter']}
+        checkpoint = Checkpoint(user_config['Checkpoint File'], checkpoint_settings, resume=resume)
+
+    # Keep each stage's result, keyed by everything it depends on, so changing a later setting only reruns later stages
+    cache = None
+    if user_config['Stage Cache (MB)']:
+        cache = StageCache(max_bytes=int(user_config['Stage Cache (MB)'] * (1 << 20)))
+    greek = greek_rotors if user_config['Reflector'].endswith('_THIN') else ()
+    # Hash only the letters of the message, so the same message with different spacing or case is found in the cache
+    letters = enigma.to_letters(enigma.to_numbers(ciphertext))
+    rotor_key = StageCache.key(
+        'rotors_and_positions', Checkpoint.fingerprint(letters), list(user_config['Rotors']), list(greek), user_config['Reflector'],
+        user_config['N-Gram File'], scorer.digest, user_config['Top N'], user_config['Prefilter'], getattr(prefilter, 'digest', None),
+        user_config['Prefilter Keep']
     )
+    ring_key = StageCache.key('ring_settings', rotor_key)
+    plugboard_key = StageCache.key('plugboard', ring_key, user_config['Max Pairs'])
+
+    if coordinator:
+        # Share the rotor search out to workers on other machines, which send back their top N
+        print('\nWaiting for workers on %s:%d to search the rotors and rotor positions...' % coordinator.address[:2])
+        search = lambda: coordinator.run(metrics)
+    else:
+        print('\nSearching for the best rotors and rotor positions...')
+        search = lambda: cryptanalysis.find_rotors_and_positions(
+            ciphertext, scorer, user_config['Top N'], user_config['Rotors'], user_config['Reflector'], user_config['Workers'],
+            prefilter, user_config['Prefilter Keep'], metrics, checkpoint, user_config['Segment Length'], greek
+        )
+    top_rotor_configs = cached_stage(cache, rotor_key, metrics, 'rotors_and_positions', search, heap_to_json, heap_from_json)
+    if coordinator:
+        # Stop listening for workers, in case the search was loaded from the cache instead
+        coordinator.server.server_close()
 
     print('\nSearching for the best ring settings...')
-    best_settings = cryptanalysis.find_ring_settings(
-        ciphertext, scorer, top_rotor_configs, user_config['Reflector']
-    )
+    best_settings = cached_stage(cache, ring_key, metrics, 'ring_settings', lambda: cryptanalysis.find_ring_settings(
+        ciphertext, scorer, top_rotor_configs, user_config['Reflector'], metrics
+    ), decode=settings_from_json)
 
     print('\nSearching for the best plugboard settings...')
-    best_settings = cryptanalysis.find_plugboard(
-        ciphertext, scorer, best_settings, user_config['Max Pairs'], user_config['Reflector']
-    )
+    best_settings = cached_stage(cache, plugboard_key, metrics, 'plugboard', lambda: cryptanalysis.find_plugboard(
+        ciphertext, scorer, best_settings, user_config['Max Pairs'], user_config['Reflector'], metrics
+    ), decode=settings_from_json)
+
+    if metrics_file:
+        metrics.export(metrics_file)
 
     print('\nRotors:', best_settings['rotors'])
     print('Rotor positions:', best_settings['rotor_positions'])
@@ -177,13 +425,116 @@ def crack_enigma(user_config, ciphertext):
     best_settings['decrypted'] = e.transform_string(ciphertext)
     print('\nDecrypted message:', best_settings['decrypted'])
 
+def crack_batch(user_config, ciphertexts):
+    if user_config['Reflector'].endswith('_THIN'):
+        print('\nBatch cryptanalysis only supports three rotor machines')
+        return
+
+    scorer, prefilter, metrics = load_crack_tools(user_config)
+    metrics_file = user_config['Metrics File']
+
+    print(f'\nSearching for the best rotors and rotor positions over {len(ciphertexts)} messages...')
+    top_rotor_orders = cryptanalysis.find_batch_rotors_and_positions(
+        ciphertexts, scorer, user_config['Top N'], user_config['Rotors'], user_config['Reflector'], user_config['Batch Rotor Orders'],
+        prefilter=prefilter, prefilter_keep=user_config['Prefilter Keep'], metrics=metrics
+    )
+
+    print('\nSearching for the best ring settings...')
+    best_settings = cryptanalysis.find_batch_ring_settings(
+        ciphertexts, scorer, top_rotor_orders, user_config['Reflector'], metrics
+    )
+
+    print('\nSearching for the best plugboard settings...')
+    best_settings = cryptanalysis.find_batch_plugboard(
+        ciphertexts, scorer, best_settings, user_config['Max Pairs'], user_config['Reflector'], metrics
+    )
+
+    if metrics_file:
+        metrics.export(metrics_file)
+
+    print('\nRotors:', best_settings['rotors'])
+    print('Ring settings:', best_settings['ring_settings'])
+    print('Plugboard settings:', best_settings['plugboard'])
+
+    # Decrypt each message from its own rotor positions
+    best_settings['decrypted'] = []
+    message_table = PrettyTable(['Message', 'Rotor Positions', 'Decrypted'])
+    message_table.align['Decrypted'] = 'l'
+    for i, (ciphertext, rotor_positions) in enumerate(zip(ciphertexts, best_settings['rotor_positions'])):
+        e = enigma.Enigma(
+            best_settings['rotors'], user_config['Reflector'],
+            rotor_positions, best_settings['ring_settings'],
+            best_settings['plugboard']
+        )
+        best_settings['decrypted'].append(e.transform_string(ciphertext))
+        message_table.add_row([i + 1, ', '.join(map(str, rotor_positions)), best_settings['decrypted'][-1]])
+    print()
+    print(message_table)
+
+def crack_with_crib(user_config, ciphertext, crib, crib_position=None, max_menus=bombe.MAX_MENUS):
+    if user_config['Reflector'].endswith('_THIN'):
+        print('\nThe crib attack only supports three rotor machines')
+        return
+    if not len(enigma.to_numbers(crib)):
+        print('\nThe crib must contain at least one letter')
+        return
+
+    scorer, _, metrics = load_crack_tools(user_config)
+    metrics_file = user_config['Metrics File']
+
+    print('\nRunning the bombe and searching each stop for ring and plugboard settings...')
+    best_settings = bombe.crack_with_crib(
+        ciphertext, crib, scorer, user_config['Rotors'], user_config['Reflector'], user_config['Max Pairs'],
+        crib_position, user_config['Top N'], max_menus=max_menus, metrics=metrics
+    )
+
+    if metrics_file:
+        metrics.export(metrics_file)
+
+    if not best_settings:
+        if crib_position is None:
+            print('\nNo stops found, try giving the crib position or testing more crib positions')
+        else:
+            print('\nNo stops found, check the crib and its position')
+        return
+
+    print('\nCrib position:', best_settings['crib_position'])
+    print('Rotors:', best_settings['rotors'])
+    print('Rotor positions:', best_settings['rotor_positions'])
+    print('Ring settings:', best_settings['ring_settings'])
+    print('Plugboard settings:', best_settings['plugboard'])
+
+    e = enigma.Enigma(
+        best_settings['rotors'], user_config['Reflector'],
+        best_settings['rotor_positions'], best_settings['ring_settings'],
+        best_settings['plugboard']
+    )
+    best_settings['decrypted'] = e.transform_string(ciphertext)
+    print('\nDecrypted message:', best_settings['decrypted'])
+
 if __name__ == "__main__":
+    args = parse_arguments()
+    if args.command == 'transform':
+        run_transform(args)
+        sys.exit()
+    if args.command == 'batch':
+        run_batch(args)
+        sys.exit()
+    if args.command == 'coordinate':
+        run_coordinate(args)
+        sys.exit()
+    if args.command == 'work':
+        distributed.run_workers(args.host, args.port, args.processes)
+        sys.exit()
+
     f = Figlet(font='big')
     print('\n' + f.renderText('Enigma'))
 
     operation_mode = PrettyTable(['Option', 'Stage'])
     operation_mode.add_row([1, 'Enigma Machine'])
     operation_mode.add_row([2, 'Cryptanalysis'])
+    operation_mode.add_row([3, 'Batch Cryptanalysis'])
+    operation_mode.add_row([4, 'Crib Attack'])
     print(operation_mode)
 
     chosen_operation = input('\nSelect option: ')
@@ -198,6 +549,26 @@ if __name__ == "__main__":
     elif chosen_operation == '2':
         user_config = get_crack_settings()
         ciphertext = input('\nEnter message to decrypt: ')
-        crack_enigma(user_config, ciphertext)
+        resume = False
+        if user_config['Checkpoint File'] and os.path.exists(user_config['Checkpoint File']):
+            resume = input('\nResume from checkpoint? (y/n): ').lower().startswith('y')
+        crack_enigma(user_config, ciphertext, resume)
+    elif chosen_operation == '3':
+        user_config = get_crack_settings()
+        # Read a file with one message per line, all sent with the same daily key
+        with open(input('\nEnter file of messages to decrypt (one per line): ').strip()) as file:
+            ciphertexts = [line.strip() for line in file if line.strip()]
+        crack_batch(user_config, ciphertexts)
+    elif chosen_operation == '4':
+        user_config = get_crack_settings()
+        ciphertext = input('\nEnter message to decrypt: ')
+        crib = input('Enter crib (known plaintext): ')
+        crib_position = input('Enter crib position (letters from the start, empty if unknown): ').strip()
+        if crib_position:
+            crack_with_crib(user_config, ciphertext, crib, int(crib_position))
+        else:
+            # Each crib position tested takes about as long as a known one, so only the most promising are tested
+            max_menus = input(f'Enter number of crib positions to test (default {bombe.MAX_MENUS}): ').strip()
+            crack_with_crib(user_config, ciphertext, crib, None, int(max_menus) if max_menus else bombe.MAX_MENUS)
     else:
         print('Invalid option selected')
@@ -0,0 +1,99 @@
+from contextlib import contextmanager
+from progressbar import progressbar
+import csv, json, os, time
+
+class Metrics:
+    # Counters and timers recorded by the cryptanalysis stages:
+    #   machines    - machine settings (keys) decrypted
+    #   characters  - characters decrypted
+    #   scorer_calls - calls to a scorer (each may score a whole batch)
+    #   scored      - texts or plugboards scored
+    #   heap_pushes, heap_replacements - entries added to the top N heap while filling and once full
+    #   pruned      - candidates dropped part way through by progressive scoring
+    #   cache_hits  - stages loaded from the stage cache rather than run
+    #   decryption, scoring - seconds spent in each
+    def __init__(self, quiet=False, callback=None):
+        self.quiet = quiet
+        self.callback = callback
+        self.stages = {}
+        self.start = time.perf_counter()
+
+    # Function to get the record for a stage, creating it on first use
+    def stage(self, name):
+        return self.stages.setdefault(name, {'counters': {}, 'timers': {}, 'best_score': None, 'done': 0, 'total': None})
+
+    def count(self, stage, name, amount=1):
+        counters = self.stage(stage)['counters']
+        counters[name] = counters.get(name, 0) + amount
+
+    @contextmanager
+    def timer(self, stage, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            timers = self.stage(stage)['timers']
+            timers[name] = timers.get(name, 0.0) + time.perf_counter() - start
+
+    # Function to record a score, keeping the best seen for the stage
+    def best(self, stage, score):
+        record = self.stage(stage)
+        if record['best_score'] is None or score > record['best_score']:
+            record['best_score'] = float(score)
+
+    # Function to iterate over a stage's work items, reporting progress with a progress bar unless quiet
+    def track(self, stage, iterable, total=None):
+        record = self.stage(stage)
+        record['total'] = total if total is not None else len(iterable)
+        items = iterable if self.quiet else progressbar(iterable, max_value=record['total'])
+        for item in items:
+            yield item
+            record['done'] += 1
+            if self.callback:
+                self.callback(self)
+
+    # Function to add the counts and timings recorded elsewhere, e.g. by a worker process
+    def merge(self, other):
+        for name, other_record in other.stages.items():
+            record = self.stage(name)
+            for counter, value in other_record['counters'].items():
+                self.count(name, counter, value)
+            for timer, value in other_record['timers'].items():
+                record['timers'][timer] = record['timers'].get(timer, 0.0) + value
+            if other_record['best_score'] is not None:
+                self.best(name, other_record['best_score'])
+
+    def as_dict(self):
+        return {'elapsed': time.perf_counter() - self.start, 'stages': self.stages}
+
+    # Function to write the metrics as JSON, or as CSV rows of stage, metric and value
+    def export(self, path):
+        temporary_path = path + '.tmp'
+        with open(temporary_path, 'w', newline='') as file:
+            if path.endswith('.csv'):
+                writer = csv.writer(file)
+                writer.writerow(['stage', 'metric', 'value'])
+                writer.writerow(['', 'elapsed', time.perf_counter() - self.start])
+                for name, record in self.stages.items():
+                    for metric in ('best_score', 'done', 'total'):
+                        writer.writerow([name, metric, record[metric]])
+                    for metric, value in {**record['counters'], **record['timers']}.items():
+                        writer.writerow([name, metric, value])
+            else:
+                json.dump(self.as_dict(), file, indent=2)
+        os.replace(temporary_path, path)
+
+    # Function to pickle only the recorded values, so metrics can be returned from worker processes
+    def __getstate__(self):
+        return {'quiet': True, 'callback': None, 'stages': self.stages, 'start': self.start}
+
+# Function to create a callback that exports metrics to a file at most once per interval
+def exporter(path, interval=5.0):
+    last_export = [float('-inf')]
+
+    def callback(metrics):
+        if time.perf_counter() - last_export[0] >= interval:
+            metrics.export(path)
+            last_export[0] = time.perf_counter()
+
+    return callback
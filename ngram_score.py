@@ -1,25 +1,157 @@
+from functools import cached_property
 from math import log10
+import hashlib, mmap, os, struct
+import numpy as np
+
+# Layout of the compiled n-gram file header: magic, format version, ngram length, padding, floor, total count, source hash
+cache_header = struct.Struct('<4sIIIdq32s')
+cache_magic = b'NGRM'
+cache_version = 1
+
+# Folder, next to the text files, that holds the compiled n-gram files
+cache_folder = '.ngram_cache'
+
+# Function to list the n-gram text files in a folder, leaving out the compiled files
+def ngram_files(folder='frequencies'):
+    return sorted(name for name in os.listdir(folder) if os.path.isfile(os.path.join(folder, name)))
 
 class ngram_score(object):
-    # Function to load ngrams from a file and calculate log probabilities
+    # Function to load ngrams from a compiled file, compiling the text file on first use or whenever it changes
     def __init__(self, ngramfile, sep=' '):
-        self.ngrams = {}
-        with open(ngramfile) as file:  # Use context manager for handling files
-            for line in file:
+        self.ngramfile = ngramfile
+        self.sep = sep
+        with open(ngramfile, 'rb') as file:
+            source = file.read()
+        digest = hashlib.sha256(source + sep.encode()).digest()
+        # Keep the hash so results scored with this file can be told apart from those of any other
+        self.digest = digest.hex()
+        cache_path = os.path.join(os.path.dirname(ngramfile), cache_folder, os.path.basename(ngramfile) + '.bin')
+        if not self.load_cache(cache_path, digest):
+            self.compile(source.decode(), sep)
+            self.save_cache(cache_path, digest)
+
+        # The highest log probability of any ngram, an upper bound on the score of each window
+        self.max = float(self.table.max())
+
+    # Function to parse the text file and calculate the dense table of log probabilities
+    def compile(self, text, sep):
+        counts = {}
+        for line in text.splitlines():
+            if line:
                 key, count = line.split(sep)
-                self.ngrams[key] = int(count)
+                counts[key] = int(count)
         self.L = len(key)
-        self.N = sum(self.ngrams.values())  # Use values() instead of itervalues()
-        # calculate log probabilities
-        for key in self.ngrams:
-            self.ngrams[key] = log10(float(self.ngrams[key]) / self.N)
+        self.N = sum(counts.values())
         self.floor = log10(0.01 / self.N)
 
-    # Function to score a text using ngrams
+        # Build a dense table of log probabilities indexed by base-26 ngram number
+        self.table = np.full(26 ** self.L, self.floor)
+        for key, count in counts.items():
+            self.table[self.index(key)] = log10(float(count) / self.N)
+
+    # Function to map a compiled file into memory, returning False if it is missing, corrupt or out of date
+    def load_cache(self, cache_path, digest):
+        try:
+            with open(cache_path, 'rb') as file:
+                mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        if len(mapping) < cache_header.size:
+            return False
+        magic, version, L, _, floor, N, source_digest = cache_header.unpack_from(mapping)
+        if (magic, version, source_digest) != (cache_magic, cache_version, digest) or len(mapping) != cache_header.size + 8 * 26 ** L:
+            return False
+
+        # The table is a read-only view of the mapped file, so every process loading it shares the same pages
+        self.L, self.N, self.floor = L, N, floor
+        self.table = np.frombuffer(mapping, dtype='<f8', count=26 ** L, offset=cache_header.size)
+        return True
+
+    # Function to write the compiled file atomically and map it, keeping the table in memory if it can't be written
+    def save_cache(self, cache_path, digest):
+        temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(temporary_path, 'wb') as file:
+                file.write(cache_header.pack(cache_magic, cache_version, self.L, 0, self.floor, self.N, digest))
+                file.write(self.table.astype('<f8').tobytes())
+            os.replace(temporary_path, cache_path)
+        except OSError:
+            return
+        self.load_cache(cache_path, digest)
+
+    # Dictionary of log probabilities for each ngram, only built if it is used
+    @cached_property
+    def ngrams(self):
+        known = np.flatnonzero(self.table != self.floor)
+        keys = known.copy()
+        letters = []
+        for _ in range(self.L):
+            letters.append(keys % 26)
+            keys //= 26
+        letters = np.stack(letters[::-1], axis=1).astype(np.uint8) + 65
+        return dict(zip((bytes(row).decode() for row in letters), self.table[known].tolist()))
+
+    # Function to pickle only the file name, so worker processes map the same compiled file instead of copying the table
+    def __getstate__(self):
+        return {'ngramfile': self.ngramfile, 'sep': self.sep}
+
+    def __setstate__(self, state):
+        self.__init__(state['ngramfile'], state['sep'])
+
+    # Function to convert an ngram string to its position in the dense table
+    def index(self, ngram):
+        number = 0
+        for char in ngram:
+            number = number * 26 + ord(char) - 65
+        return number
+
+    # Function to score a text using ngrams, where any ngram containing a character other than A-Z gets the floor
+    def score(self, text):
+        codes = np.frombuffer(text.encode('ascii', 'replace'), dtype=np.uint8).astype(np.int64) - 65
+        if len(codes) < self.L:
+            return 0
+        valid = (codes >= 0) & (codes < 26)
+        windows = len(codes) - self.L + 1
+        window_valid = np.ones(windows, dtype=bool)
+        for i in range(self.L):
+            window_valid &= valid[i:i + windows]
+        scores = np.where(window_valid, self.table[self.window_indices(np.where(valid, codes, 0))], self.floor)
+        return float(scores.sum())
+
+    # Function to convert integer-coded texts to rolling base-26 ngram indices, with none for texts shorter than an ngram
+    def window_indices(self, numbers):
+        numbers = np.asarray(numbers, dtype=np.int64)
+        windows = max(0, numbers.shape[-1] - self.L + 1)
+        indices = numbers[..., :windows].copy()
+        for i in range(1, self.L):
+            indices *= 26
+            indices += numbers[..., i:i + windows]
+        return indices
+
+    # Function to score a single integer-coded text (letters as 0-25)
+    def score_numbers(self, numbers):
+        return float(self.table[self.window_indices(numbers)].sum())
+
+    # Function to score a 2-D array of integer-coded texts, one score per row
+    def score_batch(self, numbers):
+        return self.table[self.window_indices(numbers)].sum(axis=-1)
+
+class ioc_score(object):
+    # Index of coincidence: the chance two letters drawn from a text match, higher for natural language
+    L = 1
+
+    # Function to score a text using the index of coincidence
     def score(self, text):
-        score = 0
-        ngrams = self.ngrams.get
-        for i in range(len(text) - self.L + 1):
-            # Add the log probability of each ngram in the text
-            score += ngrams(text[i:i + self.L], self.floor)
-        return score
+        return self.score_numbers(np.frombuffer(text.encode('ascii'), dtype=np.uint8) - 65)
+
+    # Function to score a single integer-coded text (letters as 0-25)
+    def score_numbers(self, numbers):
+        return float(self.score_batch(np.asarray(numbers)[None, :])[0])
+
+    # Function to score a 2-D array of integer-coded texts, one score per row
+    def score_batch(self, numbers):
+        numbers = np.asarray(numbers, dtype=np.int64)
+        rows, length = numbers.shape
+        counts = np.bincount((numbers + np.arange(rows)[:, None] * 26).ravel(), minlength=rows * 26).reshape(rows, 26)
+        return (counts * (counts - 1)).sum(axis=1) / max(1, length * (length - 1))
@@ -0,0 +1,97 @@
+import itertools
+import numpy as np
+
+class PlugboardSearch:
+    # Set up a search over plugboards for a message whose core permutations (rotors and reflector) are known
+    def __init__(self, numbers, permutations, scorer, window_valid=None):
+        self.numbers = np.asarray(numbers, dtype=np.intp)
+        self.permutations = np.asarray(permutations, dtype=np.intp)
+        self.table = scorer.table
+        self.L = scorer.L
+        self.place_values = 26 ** np.arange(self.L - 1, -1, -1)
+
+        # Windows can be masked out, e.g. where they would span two messages
+        windows = max(0, len(self.numbers) - self.L + 1)
+        self.window_valid = np.ones(windows, dtype=bool) if window_valid is None else np.asarray(window_valid, dtype=bool)
+
+        # Count the candidate plugboards scored and the windows rescored for them
+        self.evaluations = 0
+        self.windows = 0
+
+        self.set_plugboard(np.arange(26))
+
+    # Function to decrypt the whole message with a plugboard and score every window
+    def set_plugboard(self, plugboard):
+        self.plugboard = np.asarray(plugboard, dtype=np.intp)
+        positions = np.arange(len(self.numbers))
+        # Letters entering the rotors after the first pass through the plugboard, and leaving them before the second
+        self.inner = self.permutations[positions, self.plugboard[self.numbers]]
+        self.decrypted = self.plugboard[self.inner]
+        self.window_scores = self.table[self.window_indices(self.decrypted, np.arange(len(self.window_valid)))]
+        self.score = float(self.window_scores[self.window_valid].sum())
+
+    # Function to find the ngram table index of the windows starting at the given positions
+    def window_indices(self, decrypted, starts):
+        return decrypted[starts[:, None] + np.arange(self.L)] @ self.place_values
+
+    # Function to find the change in score from switching to another plugboard,
+    # only rescoring windows that touch positions whose decrypted letter can change
+    def delta(self, plugboard):
+        self.evaluations += 1
+        changed = np.flatnonzero(plugboard != self.plugboard)
+        affected = np.flatnonzero(np.isin(self.numbers, changed) | np.isin(self.inner, changed))
+        if not len(affected):
+            return 0.0
+
+        decrypted = self.decrypted.copy()
+        decrypted[affected] = plugboard[self.permutations[affected, plugboard[self.numbers[affected]]]]
+
+        starts = np.unique(affected[:, None] - np.arange(self.L))
+        starts = starts[(starts >= 0) & (starts < len(self.window_valid))]
+        starts = starts[self.window_valid[starts]]
+        self.windows += len(starts)
+        return float((self.table[self.window_indices(decrypted, starts)] - self.window_scores[starts]).sum())
+
+    # Function to list the plugboards one move away: adding, removing, swapping and re-pairing connections
+    def neighbours(self, max_pairs):
+        plugboard = self.plugboard
+        pairs = [(a, b) for a, b in enumerate(plugboard) if a < b]
+        free = [a for a, b in enumerate(plugboard) if a == b]
+
+        def move(unplug, plug):
+            candidate = plugboard.copy()
+            for a in unplug:
+                candidate[a] = a
+            for a, b in plug:
+                candidate[a], candidate[b] = b, a
+            return candidate
+
+        if len(pairs) < max_pairs:
+            for a, b in itertools.combinations(free, 2):
+                yield move([], [(a, b)])
+        for a, b in pairs:
+            yield move([a, b], [])
+            for x in free:
+                yield move([a, b], [(a, x)])
+                yield move([a, b], [(b, x)])
+        for (a, b), (c, d) in itertools.combinations(pairs, 2):
+            yield move([], [(a, c), (b, d)])
+            yield move([], [(a, d), (b, c)])
+
+    # Function to hill climb from the current plugboard, taking the best improving move until none is left
+    def climb(self, max_pairs):
+        while True:
+            best_delta, best_plugboard = 1e-9, None
+            for candidate in self.neighbours(max_pairs):
+                delta = self.delta(candidate)
+                if delta > best_delta:
+                    best_delta, best_plugboard = delta, candidate
+            if best_plugboard is None:
+                break
+            self.set_plugboard(best_plugboard)
+
+        return self.score
+
+    # Function to list the current plugboard as letter pairs
+    def connections(self):
+        return [chr(a + 65) + chr(b + 65) for a, b in enumerate(self.plugboard) if a < b]
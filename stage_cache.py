@@ -0,0 +1,81 @@
+import gzip, hashlib, json, os
+
+# Folder that holds the cached stage results
+cache_folder = '.stage_cache'
+
+# Default limit on the total size of the cached results
+DEFAULT_MAX_BYTES = 256 << 20
+
+class StageCache:
+    # Keep the results of each crack stage on disk, named by a hash of everything they depend on, so a crack
+    # repeated with only later settings changed picks up where they start to differ. The least recently used
+    # results are removed once the folder grows past its size limit
+    def __init__(self, folder=cache_folder, max_bytes=DEFAULT_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+
+    # Function to hash the settings a stage depends on into its key. Each stage includes the key of the
+    # stage before it, so changing an earlier setting changes the keys of every later stage too
+    @staticmethod
+    def key(stage, *settings):
+        return hashlib.sha256(json.dumps([stage, *settings], separators=(',', ':')).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.folder, key + '.json.gz')
+
+    # Function to load a cached result, returning None if there isn't one or it can't be read
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with gzip.open(path, 'rt') as file:
+                value = json.load(file)
+            # Mark the result as recently used
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return value
+
+    # Function to save a result atomically, then make room for it by removing the least recently used
+    def put(self, key, value):
+        path = self.path(key)
+        temporary_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            with gzip.open(temporary_path, 'wt') as file:
+                json.dump(value, file, separators=(',', ':'))
+            os.replace(temporary_path, path)
+        except OSError:
+            return
+        self.evict()
+
+    # Function to remove the least recently used results until the folder is within its size limit
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.folder):
+            if name.endswith('.json.gz'):
+                try:
+                    stat = os.stat(os.path.join(self.folder, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.folder, name))
+            except OSError:
+                continue
+            total -= size
+
+# Functions to convert a heap of the top N to and from lists of score, rotors and positions so it can be saved as JSON
+def heap_to_json(heap):
+    return [[score, list(rotors), list(positions)] for score, (rotors, positions) in heap]
+
+def heap_from_json(entries):
+    return [(score, (tuple(rotors), tuple(positions))) for score, rotors, positions in entries]
+
+# Function to restore the rotors of saved best settings to a tuple, as the search returns them
+def settings_from_json(best_settings):
+    return {**best_settings, 'rotors': tuple(best_settings['rotors'])}